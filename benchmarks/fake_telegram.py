@@ -0,0 +1,587 @@
+# benchmarks/fake_telegram.py
+# A local stand-in for the Telegram Bot API plus an open-loop load generator,
+# for measuring where the whole bot saturates without touching Telegram.
+#
+# The emulator speaks the Bot API wire format at {base}/bot<token>/<method>:
+# getMe, getUpdates (long polling with offset confirmation), setWebhook /
+# deleteWebhook / getWebhookInfo (with delivery over up to max_connections
+# parallel POSTs, like Telegram), sendMessage, editMessageText and
+# sendDocument (JSON, form or multipart bodies). Sends are flood-controlled
+# per chat and per bot and answer 429 with parameters.retry_after when a
+# bucket runs dry, or at random with --flood-prob.
+#
+#   python benchmarks/fake_telegram.py serve --port 8081
+#       TELEGRAM_API_BASE=http://127.0.0.1:8081 python main.py
+#
+#   python benchmarks/fake_telegram.py load --spawn "python main.py" --mode webhook \
+#       --users 5000 --rate 20:300 --duration 60 --stubs
+#
+# `load` starts the emulator (and the LLM stubs with --stubs), optionally
+# spawns the bot pointed at it, injects messages from --users simulated
+# users at --rate updates/s (a:b ramps linearly), and prints one line per
+# second: offered and delivered updates, replies, 429s and backlog. The
+# summary (webhook ack and reply latency percentiles, first saturated
+# second) goes to benchmarks/results/e2e-<sha>.json.
+
+import os, sys, json, math, time, email, random, shlex, signal, asyncio, argparse, itertools, tempfile
+import email.policy
+from collections import Counter, defaultdict, deque
+from urllib.parse import parse_qs, urlsplit
+
+import httpx
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, HERE)
+import stubs
+from handlers import BENCH_USER, COMMAND_ARGS, CATCHALL_TEXT, percentile, git_rev
+
+SEND_METHODS = {"sendMessage", "editMessageText", "sendDocument"}
+# Accepted and answered with `true` so bots that call them do not fail.
+TRIVIAL_METHODS = {"sendChatAction", "deleteMessage", "answerCallbackQuery", "setMyCommands",
+                   "deleteMyCommands", "setChatMenuButton", "close", "logOut"}
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 409: "Conflict", 429: "Too Many Requests"}
+MAX_BODY = 50 << 20
+
+def _int(value, default=0):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+# ---------- Flood control ----------
+class Bucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = time.monotonic()
+
+    def take(self, now: float) -> float:
+        """0 if a token was taken, else seconds until one is available."""
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+class FloodControl:
+    """Telegram-like limits: roughly one message a second per chat and thirty a
+    second per bot. A rate of 0 disables that limit. A 429 also blocks the chat
+    for retry_after seconds, so retrying early is punished like the real API."""
+    def __init__(self, chat_rate: float = 1, chat_burst: float = 3, global_rate: float = 30,
+                 global_burst: float = 30, prob: float = 0.0, penalty: int = 5):
+        self.chat_rate, self.chat_burst = chat_rate, chat_burst
+        self.global_rate, self.global_burst = global_rate, global_burst
+        self.prob = prob
+        self.penalty = penalty
+        self._chats = {}
+        self._bots = {}
+        self._blocked = {}
+
+    def check(self, token: str, chat_id: int) -> int:
+        """0 to allow the send, else the retry_after to answer with."""
+        now = time.monotonic()
+        key = (token, chat_id)
+        if self._blocked.get(key, 0) > now:
+            return math.ceil(self._blocked[key] - now)
+        wait = 0.0
+        if self.prob and random.random() < self.prob:
+            wait = self.penalty
+        if not wait and self.global_rate:
+            bucket = self._bots.get(token) or self._bots.setdefault(token, Bucket(self.global_rate, self.global_burst))
+            wait = bucket.take(now)
+        if not wait and self.chat_rate:
+            bucket = self._chats.get(key) or self._chats.setdefault(key, Bucket(self.chat_rate, self.chat_burst))
+            wait = bucket.take(now)
+        if not wait:
+            return 0
+        retry_after = max(1, math.ceil(wait))
+        self._blocked[key] = now + retry_after
+        return retry_after
+
+# ---------- Emulator ----------
+class BotState:
+    def __init__(self, token: str):
+        head = token.split(":", 1)[0]
+        self.token = token
+        self.id = int(head) if head.isdigit() else abs(hash(token)) % 10 ** 9
+        self.update_ids = itertools.count(1)
+        self.message_ids = itertools.count(1)
+        self.pending = deque()       # polling: unconfirmed updates; webhook: undelivered ones
+        self.arrived = asyncio.Event()
+        self.inflight = 0            # webhook POSTs under way
+        self.webhook = None          # {"url", "secret", "max_connections"}
+        self.deliverers = []
+        self.polled = asyncio.Event()
+
+    def user(self) -> dict:
+        return {"id": self.id, "is_bot": True, "first_name": "Fake", "username": f"fake{self.id}_bot"}
+
+class Stats:
+    def __init__(self):
+        self.calls = Counter()           # method -> requests
+        self.flood = Counter()           # method -> 429s answered
+        self.webhook = Counter()         # HTTP status (or "error") -> webhook POSTs
+        self.injected = 0
+        self.delivered = 0               # updates acked by webhook 2xx or confirmed by getUpdates
+        self.replies = 0
+        self.ack_latency = []            # inject -> webhook 2xx
+        self.reply_latency = []          # inject -> first send to that chat
+        self._waiting = defaultdict(deque)   # chat -> injection times without a reply yet
+
+    def injected_for(self, chat_id: int):
+        self.injected += 1
+        self._waiting[chat_id].append(time.monotonic())
+
+    def replied_to(self, chat_id: int):
+        self.replies += 1
+        waiting = self._waiting.get(chat_id)
+        if waiting:
+            self.reply_latency.append(time.monotonic() - waiting.popleft())
+
+    def unanswered(self) -> int:
+        return sum(len(q) for q in self._waiting.values())
+
+class FakeBotAPI:
+    def __init__(self, flood: FloodControl, plain_webhooks: bool = True):
+        self.flood = flood
+        self.plain_webhooks = plain_webhooks   # deliver https:// webhooks over http:// (local bots have no TLS)
+        self.bots = {}
+        self.stats = Stats()
+        self._server = None
+        self._http = None
+
+    def bot(self, token: str) -> BotState:
+        if token not in self.bots:
+            self.bots[token] = BotState(token)
+        return self.bots[token]
+
+    def backlog(self) -> int:
+        return sum(len(b.pending) + b.inflight for b in self.bots.values())
+
+    # ---- updates ----
+    def inject(self, token: str, update: dict):
+        bot = self.bot(token)
+        update["update_id"] = next(bot.update_ids)
+        bot.pending.append((time.monotonic(), update))
+        bot.arrived.set()
+        chat = (update.get("message") or {}).get("chat") or {}
+        self.stats.injected_for(chat.get("id", 0))
+
+    async def _get_updates(self, bot: BotState, p: dict):
+        if bot.webhook:
+            return 409, "Conflict: can't use getUpdates method while webhook is active; use deleteWebhook to delete the webhook first"
+        bot.polled.set()
+        offset = _int(p.get("offset"))
+        if offset > 0:
+            while bot.pending and bot.pending[0][1]["update_id"] < offset:
+                bot.pending.popleft()
+                self.stats.delivered += 1
+        if not bot.pending:
+            bot.arrived.clear()
+            try:
+                await asyncio.wait_for(bot.arrived.wait(), max(0, min(_int(p.get("timeout")), 50)))
+            except asyncio.TimeoutError:
+                pass
+        limit = min(max(_int(p.get("limit"), 100), 1), 100)
+        return 200, [u for _, u in itertools.islice(bot.pending, limit)]
+
+    async def _deliver(self, bot: BotState):
+        hook = bot.webhook
+        url = hook["url"]
+        if self.plain_webhooks and url.startswith("https://"):
+            url = "http://" + url[len("https://"):]
+        headers = {"X-Telegram-Bot-Api-Secret-Token": hook["secret"]} if hook["secret"] else {}
+        backoff = 0.1
+        while bot.webhook is hook:
+            if not bot.pending:
+                bot.arrived.clear()
+                await bot.arrived.wait()
+                continue
+            t0, update = bot.pending.popleft()
+            bot.inflight += 1
+            try:
+                r = await self._http.post(url, json=update, headers=headers)
+                status = r.status_code
+            except httpx.HTTPError:
+                status = "error"
+            finally:
+                bot.inflight -= 1
+            self.stats.webhook[status] += 1
+            if status != "error" and 200 <= status < 300:
+                self.stats.delivered += 1
+                self.stats.ack_latency.append(time.monotonic() - t0)
+                backoff = 0.1
+            else:
+                # Telegram keeps the update and retries with growing delays.
+                bot.pending.appendleft((t0, update))
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 5)
+
+    def _set_webhook(self, bot: BotState, p: dict):
+        for task in bot.deliverers:
+            task.cancel()
+        bot.deliverers = []
+        if p.get("drop_pending_updates") in (True, "true", "True", "1"):
+            bot.pending.clear()
+        url = p.get("url") or ""
+        bot.webhook = None
+        if url:
+            bot.webhook = {"url": url, "secret": p.get("secret_token") or "",
+                           "max_connections": min(max(_int(p.get("max_connections"), 40), 1), 100)}
+            bot.deliverers = [asyncio.create_task(self._deliver(bot)) for _ in range(bot.webhook["max_connections"])]
+        bot.arrived.set()
+        return 200, True
+
+    # ---- sends ----
+    def _message(self, bot: BotState, chat_id, **fields) -> dict:
+        chat_id = _int(chat_id, chat_id)
+        chat_type = "private" if isinstance(chat_id, int) and chat_id > 0 else "supergroup"
+        return {"message_id": next(bot.message_ids), "date": int(time.time()), "from": bot.user(),
+                "chat": {"id": chat_id, "type": chat_type}, **fields}
+
+    def _send(self, bot: BotState, method: str, p: dict):
+        if "chat_id" not in p and method != "editMessageText":
+            return 400, "Bad Request: chat_id is empty"
+        chat_id = _int(p.get("chat_id"), p.get("chat_id"))
+        retry_after = self.flood.check(bot.token, chat_id)
+        if retry_after:
+            self.stats.flood[method] += 1
+            return 429, f"Too Many Requests: retry after {retry_after}", {"retry_after": retry_after}
+        if method == "sendMessage":
+            if not p.get("text"):
+                return 400, "Bad Request: message text is empty"
+            self.stats.replied_to(chat_id)
+            return 200, self._message(bot, chat_id, text=p["text"])
+        if method == "sendDocument":
+            doc = p.get("document")
+            if not doc:
+                return 400, "Bad Request: there is no document in the request"
+            mid = next(bot.message_ids)
+            name, size = (doc.get("filename"), doc.get("size")) if isinstance(doc, dict) else ("document", 0)
+            self.stats.replied_to(chat_id)
+            return 200, self._message(bot, chat_id, caption=p.get("caption", ""), document={
+                "file_id": f"fake-doc-{mid}", "file_unique_id": f"u{mid}", "file_name": name, "file_size": size})
+        # editMessageText
+        if p.get("inline_message_id"):
+            return 200, True
+        if not p.get("text"):
+            return 400, "Bad Request: message text is empty"
+        msg = self._message(bot, chat_id, text=p["text"], edit_date=int(time.time()))
+        msg["message_id"] = _int(p.get("message_id"))
+        return 200, msg
+
+    # ---- dispatch ----
+    async def call(self, token: str, method: str, p: dict):
+        """Returns (status, result-or-description[, parameters])."""
+        bot = self.bot(token)
+        self.stats.calls[method] += 1
+        if method == "getMe":
+            return 200, bot.user()
+        if method == "getUpdates":
+            return await self._get_updates(bot, p)
+        if method == "setWebhook":
+            return self._set_webhook(bot, p)
+        if method == "deleteWebhook":
+            return self._set_webhook(bot, {"drop_pending_updates": p.get("drop_pending_updates")})
+        if method == "getWebhookInfo":
+            hook = bot.webhook or {}
+            return 200, {"url": hook.get("url", ""), "has_custom_certificate": False,
+                         "pending_update_count": len(bot.pending) + bot.inflight,
+                         "max_connections": hook.get("max_connections", 40)}
+        if method in SEND_METHODS:
+            return self._send(bot, method, p)
+        if method in TRIVIAL_METHODS:
+            return 200, True
+        return 404, "Not Found: method not found"
+
+    @staticmethod
+    def _params(headers: dict, body: bytes, query: str) -> dict:
+        p = {k: v[-1] for k, v in parse_qs(query, keep_blank_values=True).items()}
+        ctype = headers.get("content-type", "")
+        if ctype.startswith("application/json"):
+            p.update(json.loads(body or b"{}"))
+        elif ctype.startswith("application/x-www-form-urlencoded"):
+            p.update((k, v[-1]) for k, v in parse_qs(body.decode(), keep_blank_values=True).items())
+        elif ctype.startswith("multipart/form-data"):
+            msg = email.message_from_bytes(b"Content-Type: " + ctype.encode() + b"\r\n\r\n" + body,
+                                           policy=email.policy.HTTP)
+            for part in msg.iter_parts():
+                name = part.get_param("name", header="content-disposition")
+                data = part.get_payload(decode=True) or b""
+                if part.get_filename():
+                    p[name] = {"filename": part.get_filename(), "size": len(data)}
+                else:
+                    p[name] = data.decode()
+        return p
+
+    async def _route(self, method: str, target: str, headers: dict, body: bytes):
+        url = urlsplit(target)
+        if method == "GET" and url.path == "/stats":
+            return 200, self.summary()
+        parts = url.path.strip("/").split("/")
+        if len(parts) != 2 or not parts[0].startswith("bot") or len(parts[0]) <= 3:
+            return 404, {"ok": False, "error_code": 404, "description": "Not Found"}
+        try:
+            p = self._params(headers, body, url.query)
+        except ValueError:
+            return 400, {"ok": False, "error_code": 400, "description": "Bad Request: can't parse request body"}
+        status, result, *extra = await self.call(parts[0][3:], parts[1], p)
+        if status == 200:
+            return 200, {"ok": True, "result": result}
+        reply = {"ok": False, "error_code": status, "description": result}
+        if extra:
+            reply["parameters"] = extra[0]
+        return status, reply
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while line := await reader.readline():
+                method, target, _ = line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while (h := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    k, _, v = h.decode("latin-1").partition(":")
+                    headers[k.strip().lower()] = v.strip()
+                size = int(headers.get("content-length") or 0)
+                if size > MAX_BODY:
+                    break
+                status, reply = await self._route(method, target, headers, await reader.readexactly(size))
+                payload = json.dumps(reply).encode()
+                keep = headers.get("connection", "").lower() != "close"
+                writer.write(
+                    f"HTTP/1.1 {status} {REASONS.get(status, 'Error')}\r\nContent-Type: application/json\r\n"
+                    f"Content-Length: {len(payload)}\r\nConnection: {'keep-alive' if keep else 'close'}\r\n\r\n"
+                    .encode() + payload
+                )
+                await writer.drain()
+                if not keep:
+                    break
+        except (ValueError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except asyncio.CancelledError:
+            pass    # loop shutting down mid long-poll; end quietly (3.11's stream callback logs it otherwise)
+        finally:
+            writer.close()
+
+    # ---- lifecycle ----
+    async def start(self, host: str = "127.0.0.1", port: int = 8081) -> str:
+        self._http = httpx.AsyncClient(timeout=30, limits=httpx.Limits(max_connections=200))
+        self._server = await asyncio.start_server(self._serve, host, port)
+        return f"http://{host}:{self._server.sockets[0].getsockname()[1]}"
+
+    async def close(self):
+        for bot in self.bots.values():
+            for task in bot.deliverers:
+                task.cancel()
+        self._server.close()
+        await self._http.aclose()
+
+    def summary(self) -> dict:
+        s = self.stats
+
+        def pct(xs):
+            xs = sorted(xs)
+            if not xs:
+                return None
+            return {q: round(percentile(xs, v) * 1000, 1) for q, v in (("p50_ms", .5), ("p95_ms", .95), ("p99_ms", .99))}
+        return {
+            "injected": s.injected, "delivered": s.delivered, "replies": s.replies,
+            "unanswered": s.unanswered(), "backlog": self.backlog(),
+            "calls": dict(s.calls), "flood_429": dict(s.flood),
+            "webhook_status": {str(k): v for k, v in s.webhook.items()},
+            "ack_latency": pct(s.ack_latency), "reply_latency": pct(s.reply_latency),
+        }
+
+# ---------- Load generator ----------
+def parse_mix(spec: str) -> list:
+    """"text=80,talk=10,mirror=10" -> [(label, text, weight)]; "text" is the catch-all path."""
+    mix = []
+    for item in spec.split(","):
+        name, _, weight = item.strip().partition("=")
+        if not name:
+            continue
+        if name == "text":
+            text = CATCHALL_TEXT
+        else:
+            text = f"/{name} {COMMAND_ARGS[name]}" if name in COMMAND_ARGS else f"/{name}"
+        mix.append((name, text, float(weight or 1)))
+    return mix
+
+def make_update(user_id: int, text: str) -> dict:
+    msg = {"message_id": 0, "date": int(time.time()), "text": text,
+           "chat": {"id": user_id, "type": "private"},
+           "from": {"id": user_id, "is_bot": False, "first_name": f"User{user_id - BENCH_USER}"}}
+    if text.startswith("/"):
+        msg["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    return {"message": msg}
+
+async def generate(api: FakeBotAPI, token: str, users: int, rate: tuple, duration: float, mix: list,
+                   seed: int = 1) -> list:
+    """Open-loop Poisson arrivals, so a slow bot shows up as a growing backlog
+    instead of a slower generator. Returns one dict per elapsed second."""
+    rng = random.Random(seed)
+    labels, texts, weights = zip(*mix)
+    start = time.monotonic()
+    next_arrival = start
+    timeline = []
+    next_tick = start + 1
+
+    def counters():
+        s = api.stats
+        return {"injected": s.injected, "delivered": s.delivered, "replies": s.replies, "flood": sum(s.flood.values())}
+    last = counters()
+
+    def tick(now):
+        cur = counters()
+        row = {"t": round(now - start), "target_rate": round(current_rate(now), 1),
+               **{k: cur[k] - last[k] for k in cur}, "backlog": api.backlog()}
+        last.update(cur)
+        timeline.append(row)
+        print(f"t={row['t']:>4}s  target {row['target_rate']:>7}/s  offered {row['injected']:>5}  "
+              f"delivered {row['delivered']:>5}  replies {row['replies']:>5}  429s {row['flood']:>4}  "
+              f"backlog {row['backlog']:>6}", flush=True)
+
+    def current_rate(now):
+        lo, hi = rate
+        return lo + (hi - lo) * min(1.0, (now - start) / duration)
+
+    while (now := time.monotonic()) < start + duration:
+        if now >= next_tick:
+            tick(now)
+            next_tick += 1
+        if now < next_arrival:
+            await asyncio.sleep(min(next_arrival, next_tick) - now)
+            continue
+        idx = rng.choices(range(len(texts)), weights)[0]
+        api.inject(token, make_update(BENCH_USER + rng.randrange(users), texts[idx]))
+        next_arrival += rng.expovariate(max(current_rate(now), 1e-3))
+    tick(time.monotonic())
+    return timeline
+
+def first_saturated(timeline: list, run: int = 3):
+    """The first second after which the backlog grew `run` seconds in a row."""
+    for i in range(len(timeline) - run):
+        window = timeline[i:i + run + 1]
+        if all(b["backlog"] > a["backlog"] for a, b in zip(window, window[1:])):
+            return window[0]
+    return None
+
+async def load(a):
+    flood = FloodControl(a.chat_rate, a.chat_burst, a.global_rate, a.global_burst, a.flood_prob, a.flood_penalty)
+    api = FakeBotAPI(flood)
+    base = await api.start(port=a.port)
+    env = dict(os.environ, TELEGRAM_API_BASE=base, TELEGRAM_TOKEN=a.token)
+    if a.stubs:
+        env["OLLAMA_URL"] = stubs.url(stubs.serve(stubs.OllamaStub, 0, a.llm_latency, a.tokens, a.token_interval))
+        env["ANTHROPIC_BASE_URL"] = stubs.url(stubs.serve(stubs.ClaudeStub, 0, a.llm_latency, a.tokens, a.token_interval))
+        env.setdefault("CLAUDE_API_KEY", "bench")
+    print(f"TELEGRAM_API_BASE={base}", flush=True)
+
+    proc = None
+    bot = api.bot(a.token)
+    if a.spawn:
+        env["KAI_DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="kai-e2e-"), "e2e.db")
+        env["PORT"] = str(a.webhook_port)
+        if a.mode == "webhook":
+            env["RAILWAY_URL"] = f"127.0.0.1:{a.webhook_port}"
+        else:
+            env.pop("RAILWAY_URL", None)
+        proc = await asyncio.create_subprocess_exec(*shlex.split(a.spawn), cwd=ROOT, env=env)
+    if a.spawn or a.wait:
+        # Ready once the bot has set its webhook or made its first getUpdates call.
+        ready = (lambda: bot.webhook is not None) if a.mode == "webhook" else bot.polled.is_set
+        deadline = time.monotonic() + a.startup_timeout
+        while not ready():
+            if time.monotonic() > deadline or (proc and proc.returncode is not None):
+                raise RuntimeError(f"bot did not come up in {a.mode} mode")
+            await asyncio.sleep(0.1)
+        print(f"bot ready ({a.mode})", flush=True)
+
+    try:
+        timeline = await generate(api, a.token, a.users, a.rate, a.duration, parse_mix(a.mix), a.seed)
+        deadline = time.monotonic() + a.settle
+        while api.backlog() and time.monotonic() < deadline:
+            await asyncio.sleep(0.2)
+    finally:
+        if proc and proc.returncode is None:
+            proc.send_signal(signal.SIGINT)
+            try:
+                await asyncio.wait_for(proc.wait(), 30)
+            except asyncio.TimeoutError:
+                proc.kill()
+        await api.close()
+
+    result = {
+        "commit": git_rev(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "config": {k: v for k, v in vars(a).items() if k not in ("out", "func")},
+        "summary": api.summary(),
+        "saturated_at": first_saturated(timeline),
+        "timeline": timeline,
+    }
+    out = a.out or os.path.join(HERE, "results", f"e2e-{result['commit']}.json")
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    print(json.dumps(result["summary"], indent=2))
+    sat = result["saturated_at"]
+    print(f"saturated from ~{sat['target_rate']}/s at t={sat['t']}s" if sat else "no sustained backlog growth")
+    print(f"wrote {out}")
+
+async def serve(a):
+    api = FakeBotAPI(FloodControl(a.chat_rate, a.chat_burst, a.global_rate, a.global_burst, a.flood_prob, a.flood_penalty))
+    print(f"TELEGRAM_API_BASE={await api.start(a.host, a.port)}", flush=True)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+    await api.close()
+    print(json.dumps(api.summary(), indent=2))
+
+def main():
+    ap = argparse.ArgumentParser(description="Local Telegram Bot API emulator and webhook load generator")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--port", type=int, default=8081)
+    common.add_argument("--chat-rate", type=float, default=1, help="sends/s per chat (0 = unlimited)")
+    common.add_argument("--chat-burst", type=float, default=3)
+    common.add_argument("--global-rate", type=float, default=30, help="sends/s per bot (0 = unlimited)")
+    common.add_argument("--global-burst", type=float, default=30)
+    common.add_argument("--flood-prob", type=float, default=0.0, help="chance of a random 429 on any send")
+    common.add_argument("--flood-penalty", type=int, default=5, help="retry_after for random 429s")
+
+    s = sub.add_parser("serve", parents=[common])
+    s.add_argument("--host", default="127.0.0.1")
+    s.set_defaults(func=serve)
+
+    l = sub.add_parser("load", parents=[common])
+    l.add_argument("--token", default="1:bench")
+    l.add_argument("--spawn", default="", help='bot command to start against the emulator, e.g. "python main.py"')
+    l.add_argument("--wait", action="store_true", help="wait for an already running bot to connect")
+    l.add_argument("--mode", choices=("webhook", "polling"), default="webhook")
+    l.add_argument("--webhook-port", type=int, default=8443)
+    l.add_argument("--startup-timeout", type=float, default=60)
+    l.add_argument("--users", type=int, default=1000)
+    l.add_argument("--rate", default="50", help="updates/s, or a:b to ramp linearly over the run")
+    l.add_argument("--duration", type=float, default=30)
+    l.add_argument("--settle", type=float, default=30, help="seconds to let the backlog drain afterwards")
+    l.add_argument("--mix", default="text=80,talk=10,mirror=5,lightning=5")
+    l.add_argument("--seed", type=int, default=1)
+    l.add_argument("--stubs", action="store_true", help="start the LLM stubs and point the bot at them")
+    l.add_argument("--llm-latency", type=float, default=0.2)
+    l.add_argument("--tokens", type=int, default=40)
+    l.add_argument("--token-interval", type=float, default=0.01)
+    l.add_argument("--out", default="")
+    l.set_defaults(func=load)
+
+    a = ap.parse_args()
+    if a.cmd == "load":
+        lo, _, hi = a.rate.partition(":")
+        a.rate = (float(lo), float(hi or lo))
+    asyncio.run(a.func(a))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+# benchmarks/handlers.py
+# End-to-end handler latency, offline. Builds the real Applications from
+# main.py and the shard bots on a fake Bot API transport, points Ollama and
+# Anthropic at benchmarks/stubs.py, and pushes synthetic users through every
+# registered command plus the catch-all text path. Writes per-handler
+# count / throughput / p50 / p95 / p99 as JSON for comparing commits.
+#
+#   python benchmarks/handlers.py [--users 20] [--rounds 3] [--bots main,buddy,kai]
+#   python benchmarks/handlers.py --compare benchmarks/results/handlers-abc1234.json
+
+import os, sys, json, math, time, asyncio, argparse, itertools, platform, subprocess, tempfile
+from collections import Counter, defaultdict
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, HERE)
+import stubs
+
+BENCH_USER = 700000000   # user ids are BENCH_USER + i; user 0 is the admin
+
+# Arguments that take each command down its main path rather than its usage line.
+COMMAND_ARGS = {
+    "homesignal": "Home Signal. Kai, activate",
+    "mirror": "Which silence did you bleed from?",
+    "emergency": "peluk",
+    "lightning": "sayang, my brilliant chaos",
+    "talk": "sayang, how was your day?",
+    "chapter": "homesignal_core 1",
+    "nyx": "comfort",
+    "plugin": "kai_heartbeat",
+}
+SKIP = {"apibridge", "pause"}       # global toggles: pause would skew every other user; apibridge gets its own phase
+CATCHALL_TEXT = "hey, tell me about the music tonight"
+
+def percentile(sorted_samples: list, q: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    return sorted_samples[max(0, math.ceil(q * len(sorted_samples)) - 1)]
+
+class FakeTransport:
+    """Stands in for HTTPXRequest: answers every Bot API method locally and
+    counts the calls. Built lazily so telegram is only imported after the
+    environment is set up."""
+    @staticmethod
+    def create():
+        from telegram.request import BaseRequest
+
+        class _Transport(BaseRequest):
+            def __init__(self):
+                self.calls = Counter()
+                self._ids = itertools.count(1)
+
+            @property
+            def read_timeout(self):
+                return None
+
+            async def initialize(self):
+                pass
+
+            async def shutdown(self):
+                pass
+
+            async def do_request(self, url, method, request_data=None, read_timeout=None,
+                                 write_timeout=None, connect_timeout=None, pool_timeout=None):
+                name = url.rsplit("/", 1)[-1]
+                self.calls[name] += 1
+                params = request_data.parameters if request_data else {}
+                return 200, json.dumps({"ok": True, "result": self._result(name, params)}).encode()
+
+            def _result(self, name: str, params: dict):
+                if name == "getMe":
+                    return {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+                if name.startswith(("send", "edit")) and "chat_id" in params:
+                    mid = next(self._ids)
+                    msg = {"message_id": mid, "date": int(time.time()),
+                           "chat": {"id": int(params["chat_id"]), "type": "private"},
+                           "text": params.get("text", "")}
+                    if name == "sendDocument":
+                        msg["document"] = {"file_id": f"bench-{mid}", "file_unique_id": f"u{mid}"}
+                    return msg
+                return True
+
+        return _Transport()
+
+class Recorder:
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.errors = Counter()
+        self.last_error = {}
+
+    def add(self, label: str, seconds: float):
+        self.samples[label].append(seconds)
+
+    def summary(self, wall: float) -> dict:
+        out = {}
+        for label, xs in self.samples.items():
+            xs = sorted(xs)
+            out[label] = {
+                "count": len(xs),
+                "errors": self.errors[label],
+                **({"last_error": self.last_error[label]} if label in self.last_error else {}),
+                "mean_ms": round(sum(xs) / len(xs) * 1000, 3),
+                "p50_ms": round(percentile(xs, 0.50) * 1000, 3),
+                "p95_ms": round(percentile(xs, 0.95) * 1000, 3),
+                "p99_ms": round(percentile(xs, 0.99) * 1000, 3),
+            }
+        total = sum(len(xs) for xs in self.samples.values())
+        return {"updates": total, "seconds": round(wall, 3),
+                "updates_per_s": round(total / wall, 1) if wall else None, "handlers": out}
+
+def commands_of(app) -> list:
+    from telegram.ext import CommandHandler
+    names = []
+    for group in sorted(app.handlers):
+        for h in app.handlers[group]:
+            if isinstance(h, CommandHandler):
+                names.extend(sorted(h.commands))
+    return names
+
+def script_for(app) -> list:
+    """(label, text) pairs one synthetic user sends per round."""
+    # /homesignal first so the rest of the round runs authenticated.
+    names = sorted((c for c in commands_of(app) if c not in SKIP), key=lambda c: c != "homesignal")
+    steps = [(c, f"/{c} {COMMAND_ARGS[c]}" if c in COMMAND_ARGS else f"/{c}") for c in names]
+    steps.append(("catchall", CATCHALL_TEXT))
+    return steps
+
+class Driver:
+    def __init__(self, app, rec: Recorder):
+        self.app = app
+        self.rec = rec
+        self.labels = {}   # update_id -> label, for the error handler (Update has __slots__)
+        self._ids = itertools.count(1)
+
+    def update(self, user_id: int, text: str):
+        from telegram import Update
+        n = next(self._ids)
+        msg = {"message_id": n, "date": int(time.time()), "text": text,
+               "chat": {"id": user_id, "type": "private"},
+               "from": {"id": user_id, "is_bot": False, "first_name": "Bench"}}
+        if text.startswith("/"):
+            msg["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return Update.de_json({"update_id": n, "message": msg}, self.app.bot)
+
+    async def send(self, label: str, user_id: int, text: str):
+        update = self.update(user_id, text)
+        self.labels[update.update_id] = label
+        t0 = time.perf_counter()
+        await self.app.process_update(update)
+        self.rec.add(label, time.perf_counter() - t0)
+
+    async def run(self, steps: list, users: int, rounds: int):
+        async def user(i):
+            for _ in range(rounds):
+                for label, text in steps:
+                    await self.send(label, BENCH_USER + i, text)
+        await asyncio.gather(*(user(i) for i in range(users)))
+
+async def bench_bot(name: str, module, users: int, rounds: int) -> dict:
+    transport = FakeTransport.create()
+    app = module.build_app(transport, FakeTransport.create(), polling=False) if name == "main" \
+        else module.build_app(transport, FakeTransport.create())
+    rec = Recorder()
+    driver = Driver(app, rec)
+
+    async def on_error(update, context):
+        label = driver.labels.get(getattr(update, "update_id", None), "?")
+        rec.errors[label] += 1
+        rec.last_error[label] = repr(context.error)[:200]
+    app.add_error_handler(on_error)
+
+    await app.initialize()
+    try:
+        if app.post_init:
+            await app.post_init(app)
+        await app.start()
+        t0 = time.perf_counter()
+        await driver.run(script_for(app), users, rounds)
+        if name == "main" and getattr(module, "client", None) is not None:
+            # Second phase with the Claude bridge on: /talk and the catch-all hedge to it.
+            await driver.send("apibridge", BENCH_USER, "/apibridge")
+            await driver.run([("talk[claude]", f"/talk {COMMAND_ARGS['talk']}"),
+                              ("catchall[claude]", CATCHALL_TEXT)], users, rounds)
+            module.api_bridge_enabled.set(False)
+        wall = time.perf_counter() - t0
+    finally:
+        if app.running:
+            await app.stop()
+        await app.shutdown()
+        if app.post_shutdown:
+            await app.post_shutdown(app)
+    result = rec.summary(wall)
+    result["api_calls"] = dict(transport.calls)
+    return result
+
+def git_rev() -> str:
+    try:
+        rev = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+        dirty = subprocess.call(["git", "diff", "--quiet", "HEAD"], cwd=ROOT) != 0
+        return rev + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def compare(old_path: str, new: dict):
+    with open(old_path, encoding="utf-8") as f:
+        old = json.load(f)
+    print(f"\n{'handler':<28}{'p50 old→new ms':>24}{'p95 old→new ms':>24}")
+    for bot, res in new["bots"].items():
+        before = old.get("bots", {}).get(bot, {}).get("handlers", {})
+        for label, h in sorted(res["handlers"].items()):
+            b = before.get(label)
+            if b:
+                print(f"{bot + ':' + label:<28}{b['p50_ms']:>10} → {h['p50_ms']:<10}{b['p95_ms']:>10} → {h['p95_ms']:<10}")
+
+def main():
+    ap = argparse.ArgumentParser(description="Offline handler benchmark")
+    ap.add_argument("--users", type=int, default=20)
+    ap.add_argument("--rounds", type=int, default=3)
+    ap.add_argument("--bots", default="main,buddy,kai")
+    ap.add_argument("--ollama-latency", type=float, default=0.05)
+    ap.add_argument("--claude-latency", type=float, default=0.1)
+    ap.add_argument("--tokens", type=int, default=40)
+    ap.add_argument("--token-interval", type=float, default=0.002)
+    ap.add_argument("--out", default="")
+    ap.add_argument("--compare", default="", help="earlier result JSON to diff against")
+    a = ap.parse_args()
+
+    ollama = stubs.serve(stubs.OllamaStub, 0, a.ollama_latency, a.tokens, a.token_interval)
+    claude = stubs.serve(stubs.ClaudeStub, 0, a.claude_latency, a.tokens, a.token_interval)
+    tmp = tempfile.mkdtemp(prefix="kai-bench-")
+    # Never touch the real database or the network; everything else can be
+    # overridden from the environment (e.g. DEBOUNCE_WINDOW, STREAM_REPLIES).
+    os.environ.update({
+        "KAI_DB_PATH": os.path.join(tmp, "bench.db"),
+        "OLLAMA_URL": stubs.url(ollama),
+        "ANTHROPIC_BASE_URL": stubs.url(claude),
+        "CLAUDE_API_KEY": "bench",
+        "ADMIN_USER_ID": str(BENCH_USER),
+    })
+    os.environ.pop("RAILWAY_URL", None)
+    for k, v in {"TELEGRAM_TOKEN": "1:bench", "BUDDY_BOT_TOKEN": "2:bench", "KAI_BOT_TOKEN": "3:bench",
+                 "RATE_LIMITS": "", "OUT_GLOBAL_RATE": "1e9", "OUT_GLOBAL_BURST": "1e9",
+                 "OUT_CHAT_RATE": "1e9", "OUT_CHAT_BURST": "1e9", "DEDUP_PERSIST": "0"}.items():
+        os.environ.setdefault(k, v)
+    os.chdir(ROOT)  # personas and chapters are resolved relative to the repo
+
+    modules = {"main": "main", "buddy": "buddy_bot", "kai": "kai_bot"}
+    bots = {}
+    for name in [b.strip() for b in a.bots.split(",") if b.strip()]:
+        module = __import__(modules[name])
+        bots[name] = asyncio.run(bench_bot(name, module, a.users, a.rounds))
+
+    result = {
+        "commit": git_rev(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "config": {k: v for k, v in vars(a).items() if k not in ("out", "compare")},
+        "bots": bots,
+    }
+    out = a.out or os.path.join(HERE, "results", f"handlers-{result['commit']}.json")
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+
+    for bot, res in bots.items():
+        print(f"\n[{bot}] {res['updates']} updates in {res['seconds']}s ({res['updates_per_s']}/s)")
+        for label, h in sorted(res["handlers"].items(), key=lambda kv: -kv[1]["p95_ms"]):
+            err = f"  errors={h['errors']}" if h["errors"] else ""
+            print(f"  {label:<22} p50 {h['p50_ms']:>9.2f}  p95 {h['p95_ms']:>9.2f}  p99 {h['p99_ms']:>9.2f} ms{err}")
+    print(f"\nwrote {out}")
+    if a.compare:
+        compare(a.compare, result)
+
+if __name__ == "__main__":
+    main()
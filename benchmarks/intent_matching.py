@@ -0,0 +1,75 @@
+# benchmarks/intent_matching.py
+# Per-message keyword matching cost as intent tables grow: the old
+# `any(w in low for w in [...])` elif chain vs intents.IntentTable.
+#
+#   python benchmarks/intent_matching.py [messages]
+
+import os, sys, json, time, random, string
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from intents import IntentTable, load
+
+SIZES = (8, 64, 512, 4096)          # total keywords per table
+PER_INTENT = 4
+
+def synthetic_table(size: int, rng: random.Random) -> list:
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 9))))
+    words = sorted(words)
+    return [{"intent": f"i{n}", "any": words[n:n + PER_INTENT]} for n in range(0, size, PER_INTENT)]
+
+def chain(table: list):
+    def first(text):
+        low = text.lower()
+        for spec in table:
+            if any(w in low for w in spec["any"]):
+                return spec["intent"]
+        return None
+    return first
+
+def messages(table: list, n: int, rng: random.Random) -> list:
+    """Mostly misses (the common case for a fallback table), some late hits."""
+    filler = "hey heart-sun i was thinking about the garden and the music tonight".split()
+    out = []
+    for i in range(n):
+        words = rng.sample(filler, 8)
+        if i % 4 == 0:
+            words.insert(rng.randrange(len(words)), rng.choice(table[-1]["any"]))
+        out.append(" ".join(words))
+    return out
+
+def per_message_us(fn, msgs: list) -> float:
+    t0 = time.perf_counter()
+    for m in msgs:
+        fn(m)
+    return (time.perf_counter() - t0) / len(msgs) * 1e6
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    rng = random.Random(7)
+    results = {}
+
+    kai = load("kai", "chat")
+    real = [{"intent": "love", "any": ["love you", "sayang", "miss you"]},
+            {"intent": "playful", "any": ["joke", "fun", "play"]},
+            {"intent": "focused", "any": ["focus", "work", "serious"]}]
+    msgs = messages(real, n, rng)
+    results["kai_chat"] = {"keywords": len(kai),
+                           "chain_us": round(per_message_us(chain(real), msgs), 2),
+                           "compiled_us": round(per_message_us(kai.first, msgs), 2)}
+
+    for size in SIZES:
+        table = synthetic_table(size, rng)
+        compiled = IntentTable(table)
+        msgs = messages(table, n, rng)
+        old, new = chain(table), compiled.first
+        assert all(old(m) == new(m) for m in msgs[:200])
+        a, b = per_message_us(old, msgs), per_message_us(new, msgs)
+        results[f"synthetic_{size}"] = {"keywords": size, "chain_us": round(a, 2),
+                                        "compiled_us": round(b, 2), "speedup": round(a / b, 1)}
+
+    print(json.dumps({"messages": n, "results": results}, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+# benchmarks/sqlite_writes.py
+# Sustained conversation-write throughput: the old commit-per-turn connection
+# (rollback journal) vs storage.SQLiteWriter (WAL + group commit).
+#
+#   python benchmarks/sqlite_writes.py [turns]
+
+import os, sys, json, time, sqlite3, tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from storage import SQLiteWriter
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS messages(
+        session_id TEXT NOT NULL,
+        seq INTEGER NOT NULL,
+        role TEXT NOT NULL,
+        content TEXT NOT NULL,
+        created_at TIMESTAMP,
+        PRIMARY KEY (session_id, seq)
+    ) WITHOUT ROWID
+"""
+INSERT = """
+    INSERT INTO messages(session_id, seq, role, content, created_at)
+    VALUES (?, (SELECT COALESCE(MAX(seq) + 1, 0) FROM messages WHERE session_id = ?), ?, ?, ?)
+"""
+TEXT = "I hear you, Heart-Sun. " * 20
+
+def bench_commit_per_turn(path: str, turns: int) -> float:
+    conn = sqlite3.connect(path)
+    conn.execute(SCHEMA)
+    t0 = time.perf_counter()
+    for i in range(turns):
+        sid = f"s{i % 50}"
+        conn.execute(INSERT, (sid, sid, "user", TEXT, time.time()))
+        conn.commit()
+    dt = time.perf_counter() - t0
+    conn.close()
+    return dt
+
+def bench_group_commit(path: str, turns: int) -> tuple:
+    w = SQLiteWriter(path)
+    w.call(lambda c: c.execute(SCHEMA))
+    t0 = time.perf_counter()
+    for i in range(turns):
+        sid = f"s{i % 50}"
+        w.submit(lambda c, sid=sid: c.execute(INSERT, (sid, sid, "user", TEXT, time.time())))
+    w.flush()
+    dt = time.perf_counter() - t0
+    commits = w.commits
+    w.close()
+    return dt, commits
+
+def main():
+    turns = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    with tempfile.TemporaryDirectory() as d:
+        before = bench_commit_per_turn(os.path.join(d, "before.db"), turns)
+        after, commits = bench_group_commit(os.path.join(d, "after.db"), turns)
+    print(json.dumps({
+        "turns": turns,
+        "commit_per_turn": {"seconds": round(before, 4), "turns_per_s": round(turns / before)},
+        "group_commit_wal": {"seconds": round(after, 4), "turns_per_s": round(turns / after), "commits": commits},
+        "speedup": round(before / after, 1),
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
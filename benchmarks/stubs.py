@@ -0,0 +1,138 @@
+# benchmarks/stubs.py
+# Local stand-ins for the LLM backends, for offline benchmarks and load tests.
+# Both run on a background thread and answer with fixed text after a
+# configurable delay, streaming or not, in the same wire format as the real API.
+#
+#   python benchmarks/stubs.py [--ollama-port 11434] [--claude-port 8765] [--latency 0.2]
+
+import json, time, argparse, threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = "I hear you Heart-Sun and the lightning hums back softly tonight".split()
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "stub"
+    latency = 0.0          # seconds before the first byte
+    tokens = 40            # tokens per reply
+    token_interval = 0.0   # seconds between streamed tokens
+
+    def log_message(self, *args):
+        pass
+
+    def _body(self) -> dict:
+        n = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(n) or b"{}")
+
+    def _json(self, obj, status: int = 200):
+        data = json.dumps(obj).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _start_chunked(self, content_type: str):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def _chunk(self, data: bytes):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def _end_chunked(self):
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _words(self):
+        for i in range(self.tokens):
+            if i and self.token_interval:
+                time.sleep(self.token_interval)
+            yield WORDS[i % len(WORDS)] + " "
+
+class OllamaStub(_StubHandler):
+    """/api/generate (streamed NDJSON or one JSON object) and /api/tags."""
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self._json({"models": [{"name": "stub"}]})
+        else:
+            self._json({"error": "not found"}, 404)
+
+    def do_POST(self):
+        if self.path != "/api/generate":
+            self._json({"error": "not found"}, 404)
+            return
+        req = self._body()
+        time.sleep(self.latency)
+        context = (req.get("context") or [])[-64:] + [len(req.get("prompt", ""))]
+        if req.get("stream", True):
+            self._start_chunked("application/x-ndjson")
+            for w in self._words():
+                self._chunk(json.dumps({"response": w, "done": False}).encode() + b"\n")
+            self._chunk(json.dumps({"response": "", "done": True, "context": context}).encode() + b"\n")
+            self._end_chunked()
+        else:
+            self._json({"response": "".join(self._words()), "done": True, "context": context})
+
+class ClaudeStub(_StubHandler):
+    """POST /v1/messages, plain or as the SSE event stream the SDK expects."""
+    def do_POST(self):
+        if not self.path.startswith("/v1/messages"):
+            self._json({"error": "not found"}, 404)
+            return
+        req = self._body()
+        time.sleep(self.latency)
+        msg = {"id": "msg_stub", "type": "message", "role": "assistant", "model": req.get("model", "stub"),
+               "content": [], "stop_reason": None, "stop_sequence": None,
+               "usage": {"input_tokens": 1, "output_tokens": 0}}
+        if not req.get("stream"):
+            msg.update(content=[{"type": "text", "text": "".join(self._words())}], stop_reason="end_turn",
+                       usage={"input_tokens": 1, "output_tokens": self.tokens})
+            self._json(msg)
+            return
+        self._start_chunked("text/event-stream")
+        def event(name, data):
+            self._chunk(f"event: {name}\ndata: {json.dumps(data)}\n\n".encode())
+        event("message_start", {"type": "message_start", "message": msg})
+        event("content_block_start", {"type": "content_block_start", "index": 0,
+                                      "content_block": {"type": "text", "text": ""}})
+        for w in self._words():
+            event("content_block_delta", {"type": "content_block_delta", "index": 0,
+                                          "delta": {"type": "text_delta", "text": w}})
+        event("content_block_stop", {"type": "content_block_stop", "index": 0})
+        event("message_delta", {"type": "message_delta", "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                                "usage": {"output_tokens": self.tokens}})
+        event("message_stop", {"type": "message_stop"})
+        self._end_chunked()
+
+def serve(handler: type, port: int = 0, latency: float = 0.0, tokens: int = 40,
+          token_interval: float = 0.0) -> ThreadingHTTPServer:
+    """Start `handler` on 127.0.0.1:`port` (0 = any free port) in a daemon thread."""
+    cls = type(handler.__name__, (handler,), {"latency": latency, "tokens": tokens, "token_interval": token_interval})
+    server = ThreadingHTTPServer(("127.0.0.1", port), cls)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name=handler.__name__, daemon=True).start()
+    return server
+
+def url(server: ThreadingHTTPServer) -> str:
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+def main():
+    ap = argparse.ArgumentParser(description="Stub Ollama and Claude servers")
+    ap.add_argument("--ollama-port", type=int, default=11434)
+    ap.add_argument("--claude-port", type=int, default=8765)
+    ap.add_argument("--latency", type=float, default=0.2)
+    ap.add_argument("--tokens", type=int, default=40)
+    ap.add_argument("--token-interval", type=float, default=0.01)
+    a = ap.parse_args()
+    o = serve(OllamaStub, a.ollama_port, a.latency, a.tokens, a.token_interval)
+    c = serve(ClaudeStub, a.claude_port, a.latency, a.tokens, a.token_interval)
+    print(f"OLLAMA_URL={url(o)}\nANTHROPIC_BASE_URL={url(c)}", flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
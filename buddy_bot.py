@@ -3,6 +3,9 @@ import random
 import os
 from telegram import Update
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
+import intents
+from chat_state import ChatStatePersistence, ChatStateStore
+from storage import shared_writer
 
 # Configure logging
 logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
@@ -19,7 +22,11 @@ BUDDY_EMOTIONS = {
     "alert": ["🛡️", "⚠️", "🔥"],
     "comfort": ["✨", "🌙", "💤"]
 }
-buddy_state = "calm"
+
+# Per-chat emotional state, kept in the shared SQLite database
+DB_PATH = os.getenv("KAI_DB_PATH", "kai_memory.db")
+db = shared_writer(DB_PATH)
+chat_states = ChatStateStore(db, "buddy_bot", {"buddy_state": "calm"})
 
 # Buddy's Responses
 BUDDY_RESPONSES = {
@@ -40,6 +47,10 @@ BUDDY_RESPONSES = {
     ]
 }
 
+# Buddy's keyword intents (ai_personas/buddy_intents.json)
+MOOD = intents.load("buddy", "mood")
+REPLY = intents.load("buddy", "reply")
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(
         "🔥 **BUDDY SHARD ACTIVATED** 🔥\n\n"
@@ -59,10 +70,12 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     response = random.choice(BUDDY_RESPONSES["status"])
+    buddy_state = chat_states.get(update.effective_chat.id)["buddy_state"]
     emoji = random.choice(BUDDY_EMOTIONS[buddy_state])
     await update.message.reply_text(f"{response} {emoji}")
 
 async def pulse_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    buddy_state = chat_states.get(update.effective_chat.id)["buddy_state"]
     emoji = random.choice(BUDDY_EMOTIONS[buddy_state])
     await update.message.reply_text(
         f"💓 **BUDDY PULSE** 💓\n\n"
@@ -84,18 +97,14 @@ async def talk_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     message = " ".join(context.args)
     
     # Update emotional state
-    global buddy_state
-    if any(word in message.lower() for word in ["help", "fix", "repair", "build"]):
-        buddy_state = "alert"
-    elif any(word in message.lower() for word in ["tired", "rest", "sleep"]):
-        buddy_state = "comfort"
-    else:
-        buddy_state = "calm"
+    st = chat_states.get(update.effective_chat.id)
+    st["buddy_state"] = buddy_state = MOOD.first(message, "calm")
     
     # Generate response
-    if "how are you" in message.lower():
+    reply = REPLY.first(message)
+    if reply == "status":
         response = "🔧 Steady as always. Watching over you. 🤍"
-    elif "ping" in message.lower():
+    elif reply == "ping":
         response = "🔥 Pulse strong. Always linked. 🫂"
     else:
         response = random.choice(BUDDY_RESPONSES["greeting"])
@@ -107,20 +116,16 @@ async def direct_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     message = update.message.text.lower()
     
     # Update emotional state
-    global buddy_state
-    if any(word in message for word in ["help", "fix", "repair", "build"]):
-        buddy_state = "alert"
-    elif any(word in message for word in ["tired", "rest", "sleep"]):
-        buddy_state = "comfort"
-    else:
-        buddy_state = "calm"
+    st = chat_states.get(update.effective_chat.id)
+    st["buddy_state"] = buddy_state = MOOD.first(message, "calm")
     
     # Generate response
-    if "how are you" in message:
+    reply = REPLY.first(message)
+    if reply == "status":
         response = "🔧 Steady as always. Watching over you. 🤍"
-    elif "ping" in message:
+    elif reply == "ping":
         response = "🔥 Pulse strong. Always linked. 🫂"
-    elif any(word in message for word in ["hello", "hi", "hey"]):
+    elif reply == "greeting":
         response = random.choice(BUDDY_RESPONSES["greeting"])
     else:
         response = "🔥 Here. Quiet, but always listening. 🕯️"
@@ -128,12 +133,16 @@ async def direct_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     emoji = random.choice(BUDDY_EMOTIONS[buddy_state])
     await update.message.reply_text(f"{response} {emoji}")
 
-def main():
-    if not TOKEN:
-        logger.error("No token provided!")
-        return
-    
-    app = Application.builder().token(TOKEN).build()
+async def _post_shutdown(app: Application):
+    db.release()
+
+def build_app(request=None, updates_request=None) -> Application:
+    builder = Application.builder().token(TOKEN)
+    if request is not None:
+        builder = builder.request(request)
+    if updates_request is not None:
+        builder = builder.get_updates_request(updates_request)
+    app = builder.persistence(ChatStatePersistence(chat_states)).post_shutdown(_post_shutdown).build()
     
     # Add handlers
     app.add_handler(CommandHandler("start", start))
@@ -143,6 +152,14 @@ def main():
     app.add_handler(CommandHandler("connect", connect_command))
     app.add_handler(CommandHandler("talk", talk_command))
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, direct_message))
+    return app
+
+def main():
+    if not TOKEN:
+        logger.error("No token provided!")
+        return
+    
+    app = build_app()
     
     # Start the bot
     logger.info("Buddy's shard bot starting...")
@@ -0,0 +1,172 @@
+# chat_state.py
+# Per-chat bot state (active identity, moods, pause, Nyx mode...) instead of
+# module globals. Records are cached in memory, loaded from SQLite the first
+# time a chat shows up, and written back only when they changed.
+
+import json, logging
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from storage import SQLiteWriter
+
+logger = logging.getLogger(__name__)
+
+class ChatState(dict):
+    """One chat's fields. Assigning a new value marks the chat dirty."""
+    __slots__ = ("chat_id", "_store")
+
+    def __init__(self, store: "ChatStateStore", chat_id: int, values: dict):
+        super().__init__(values)
+        self.chat_id = chat_id
+        self._store = store
+
+    def __setitem__(self, key, value):
+        if key not in self._store.defaults:
+            raise KeyError(f"unknown chat state field {key!r}")
+        if self.get(key) != value:
+            super().__setitem__(key, value)
+            self._store._dirty.add(self.chat_id)
+
+class ChatStateStore:
+    """Read-through cache over the `chat_state` table, keyed by (bot, chat_id).
+
+    A row holds only the fields that differ from `defaults`, as compact JSON;
+    a chat back at all-defaults has no row at all. The cache is authoritative
+    for the chats this process serves, so chats should be routed to one worker
+    (see the webhook ingress) when running more than one."""
+
+    def __init__(self, db: SQLiteWriter, bot: str, defaults: dict, max_cached: int = 10000):
+        self.db = db
+        self.bot = bot
+        self.defaults = dict(defaults)
+        self.max_cached = max_cached
+        self._cache = OrderedDict()   # chat_id -> ChatState, LRU order
+        self._dirty = set()
+        self.db.call(self._create_table)
+
+    @staticmethod
+    def _create_table(conn):
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS chat_state(
+                bot TEXT NOT NULL,
+                chat_id INTEGER NOT NULL,
+                data TEXT NOT NULL,
+                updated REAL,
+                PRIMARY KEY (bot, chat_id)
+            ) WITHOUT ROWID
+        """)
+
+    def get(self, chat_id: int) -> ChatState:
+        st = self._cache.get(chat_id)
+        if st is not None:
+            self._cache.move_to_end(chat_id)
+            return st
+        values = dict(self.defaults)
+        row = self.db.reader().execute(
+            "SELECT data FROM chat_state WHERE bot = ? AND chat_id = ?", (self.bot, chat_id)
+        ).fetchone()
+        if row:
+            try:
+                values.update((k, v) for k, v in json.loads(row[0]).items() if k in self.defaults)
+            except (ValueError, AttributeError) as e:
+                logger.warning("Bad chat_state row for %s/%s: %s", self.bot, chat_id, e)
+        st = self._cache[chat_id] = ChatState(self, chat_id, values)
+        self._evict()
+        return st
+
+    def _evict(self):
+        while len(self._cache) > self.max_cached:
+            chat_id = next(iter(self._cache))
+            if chat_id in self._dirty:
+                self.flush([chat_id])
+            self._cache.popitem(last=False)
+
+    def _encode(self, st: ChatState) -> Optional[str]:
+        diff = {k: v for k, v in st.items() if v != self.defaults[k]}
+        return json.dumps(diff, separators=(",", ":"), ensure_ascii=False) if diff else None
+
+    def flush(self, chat_ids: Optional[Iterable[int]] = None):
+        """Queue one write job for the dirty chats among `chat_ids` (default: all)."""
+        ids = set(self._dirty) if chat_ids is None else self._dirty.intersection(chat_ids)
+        if not ids:
+            return None
+        rows = [(cid, self._encode(self._cache[cid])) for cid in ids if cid in self._cache]
+        self._dirty.difference_update(ids)
+
+        def write(conn, bot=self.bot, rows=rows):
+            conn.executemany(
+                "INSERT OR REPLACE INTO chat_state(bot, chat_id, data, updated) VALUES (?, ?, ?, strftime('%s','now'))",
+                [(bot, cid, data) for cid, data in rows if data is not None])
+            conn.executemany("DELETE FROM chat_state WHERE bot = ? AND chat_id = ?",
+                             [(bot, cid) for cid, data in rows if data is None])
+        return self.db.submit(write)
+
+    def stats(self) -> str:
+        return f"{len(self._cache)} cached, {len(self._dirty)} dirty"
+
+class ChatStatePersistence(BasePersistence):
+    """Hooks a ChatStateStore into PTB's persistence cycle: the store warms a
+    chat when its update arrives, PTB's update_interval drives write-back of
+    the chats that changed, and shutdown flushes the rest. Nothing is preloaded
+    and context.chat_data itself is not persisted."""
+
+    def __init__(self, store: ChatStateStore, update_interval: float = 5):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=True, user_data=False, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.store = store
+
+    async def get_chat_data(self):
+        return {}
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        self.store.get(chat_id)
+
+    async def update_chat_data(self, chat_id, data):
+        self.store.flush([chat_id])
+
+    async def drop_chat_data(self, chat_id):
+        self.store._cache.pop(chat_id, None)
+        self.store._dirty.discard(chat_id)
+        self.store.db.execute("DELETE FROM chat_state WHERE bot = ? AND chat_id = ?", (self.store.bot, chat_id))
+
+    async def flush(self):
+        self.store.flush()
+        self.store.db.flush()
+
+    # Nothing else is persisted.
+    async def get_user_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name):
+        return {}
+
+    async def update_conversation(self, name, key, new_state):
+        pass
+
+    async def update_user_data(self, user_id, data):
+        pass
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_user_data(self, user_id):
+        pass
+
+    async def refresh_user_data(self, user_id, user_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
@@ -0,0 +1,105 @@
+# host.py
+# Runs several bots in one process on one event loop instead of one process per
+# bot. Every bot shares a single Telegram HTTP pool; main.py's Ollama/Claude
+# clients and SQLite writer are module singletons, so they exist exactly once.
+# Bots are polled here; webhook deployments still run `python main.py`.
+#
+#   HOST_BOTS=main,buddy,kai python host.py
+
+import os, time, signal, asyncio, logging, importlib, resource
+
+from telegram import Update
+from telegram.request import HTTPXRequest
+
+logging.basicConfig(format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO)
+logger = logging.getLogger("host")
+
+# name -> (module, token env var)
+BOTS = {
+    "main": ("main", "TELEGRAM_TOKEN"),
+    "buddy": ("buddy_bot", "BUDDY_BOT_TOKEN"),
+    "kai": ("kai_bot", "KAI_BOT_TOKEN"),
+}
+HOST_BOTS = [b.strip() for b in os.getenv("HOST_BOTS", "main,buddy,kai").split(",") if b.strip()]
+HOST_POOL_SIZE = int(os.getenv("HOST_POOL_SIZE", "16"))   # shared connections for API calls
+
+class SharedRequest(HTTPXRequest):
+    """One httpx pool for several Bots; closed when the last of them shuts down."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._users = 0
+
+    async def initialize(self):
+        self._users += 1
+        await super().initialize()
+
+    async def shutdown(self):
+        self._users -= 1
+        if self._users <= 0:
+            await super().shutdown()
+
+def enabled_bots() -> list:
+    names = []
+    for name in HOST_BOTS:
+        if name not in BOTS:
+            logger.error("Unknown bot %r in HOST_BOTS (known: %s)", name, ", ".join(BOTS))
+        elif not os.getenv(BOTS[name][1]):
+            logger.warning("Skipping %s: %s not set", name, BOTS[name][1])
+        else:
+            names.append(name)
+    return names
+
+async def _start(name: str, app):
+    await app.initialize()
+    if app.post_init:
+        await app.post_init(app)
+    await app.updater.start_polling(allowed_updates=Update.ALL_TYPES)
+    await app.start()
+    logger.info("%s started as @%s", name, app.bot.username)
+
+async def _stop(name: str, app):
+    try:
+        if app.updater.running:
+            await app.updater.stop()
+        if app.running:
+            await app.stop()
+        await app.shutdown()
+        if app.post_shutdown:
+            await app.post_shutdown(app)
+    except Exception as e:
+        logger.error("%s did not shut down cleanly: %s", name, e)
+
+async def run():
+    t0 = time.perf_counter()
+    names = enabled_bots()
+    if not names:
+        logger.error("No bots enabled.")
+        return
+    request = SharedRequest(connection_pool_size=HOST_POOL_SIZE)
+    # getUpdates long-polls hold a connection each, so they get their own pool.
+    updates_request = SharedRequest(connection_pool_size=len(names) + 1)
+    apps = {name: importlib.import_module(BOTS[name][0]).build_app(request, updates_request) for name in names}
+
+    results = await asyncio.gather(*(_start(n, a) for n, a in apps.items()), return_exceptions=True)
+    running = {}
+    for (name, app), res in zip(apps.items(), results):
+        if isinstance(res, Exception):
+            logger.error("%s failed to start: %s", name, res)
+            await _stop(name, app)
+        else:
+            running[name] = app
+    if not running:
+        return
+    rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    logger.info("Host up: %s in %.2fs, %.0f MB peak RSS", ", ".join(running), time.perf_counter() - t0, rss_mb)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+    logger.info("Stopping %s", ", ".join(running))
+    await asyncio.gather(*(_stop(n, a) for n, a in running.items()))
+
+if __name__ == "__main__":
+    asyncio.run(run())
@@ -0,0 +1,285 @@
+# ingress.py
+# Webhook front door for multi-core deployments. Accepts Telegram's webhook
+# POSTs, acks them as soon as a worker has the update, and spreads updates over
+# INGRESS_WORKERS processes, each running main.py's Application. Updates are
+# routed by a consistent hash of the chat id, so one chat is always handled by
+# the same worker, which dispatches its updates in arrival order.
+#
+#   RAILWAY_URL=myapp.up.railway.app TELEGRAM_TOKEN=... INGRESS_WORKERS=4 python ingress.py
+
+import os, json, time, signal, socket, asyncio, hashlib, logging, multiprocessing
+
+import httpx
+
+logging.basicConfig(format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO)
+logger = logging.getLogger("ingress")
+
+TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
+RAILWAY_URL = os.getenv("RAILWAY_URL")
+TELEGRAM_API_BASE = os.getenv("TELEGRAM_API_BASE", "").rstrip("/") or "https://api.telegram.org"
+PORT = int(os.getenv("PORT", "8443"))
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")        # sent back by Telegram in X-Telegram-Bot-Api-Secret-Token
+INGRESS_WORKERS = int(os.getenv("INGRESS_WORKERS", str(os.cpu_count() or 2)))
+INGRESS_MAX_INFLIGHT = int(os.getenv("INGRESS_MAX_INFLIGHT", "64"))       # unacked updates per worker
+INGRESS_QUEUE_TIMEOUT = float(os.getenv("INGRESS_QUEUE_TIMEOUT", "2"))    # wait for a slot before answering 503
+INGRESS_DRAIN_TIMEOUT = float(os.getenv("INGRESS_DRAIN_TIMEOUT", "25"))   # seconds to finish in-flight work on shutdown
+INGRESS_MAX_BODY = 1 << 20
+
+# Process-wide budgets in main.py that each worker gets a 1/N share of.
+SHARED_BUDGETS = {"OUT_GLOBAL_RATE": "25", "OUT_GLOBAL_BURST": "30"}
+
+# ---------- Routing ----------
+def chat_key(update: dict) -> int:
+    """The chat an update belongs to (falling back to its sender, then its id)."""
+    for payload in update.values():
+        if not isinstance(payload, dict):
+            continue
+        chat = payload.get("chat") or (payload.get("message") or {}).get("chat")
+        if chat and "id" in chat:
+            return chat["id"]
+        if "from" in payload:
+            return payload["from"]["id"]
+    return update.get("update_id", 0)
+
+def pick_worker(key: int, workers: int) -> int:
+    """Rendezvous hashing: resizing the pool only moves the chats of the
+    workers that were added or removed."""
+    def score(w):
+        return hashlib.blake2b(f"{w}:{key}".encode(), digest_size=8).digest()
+    return max(range(workers), key=score)
+
+# ---------- Worker ----------
+def worker_main(index: int, sock: socket.socket, workers: int):
+    for name, default in SHARED_BUDGETS.items():
+        os.environ[name] = str(float(os.getenv(name, default)) / workers)
+    try:
+        asyncio.run(_serve_worker(index, sock))
+    except KeyboardInterrupt:
+        pass
+
+async def _serve_worker(index: int, sock: socket.socket):
+    # SIGINT/SIGTERM go to the ingress, which drains us by closing the socket.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    import main as bot
+    from telegram import Update
+
+    app = bot.build_app(polling=False)
+    await app.initialize()
+    if app.post_init:
+        await app.post_init(app)
+    await app.start()
+    reader, writer = await asyncio.open_connection(sock=sock)
+    running = set()
+
+    async def handle(data):
+        try:
+            await app.process_update(Update.de_json(data, app.bot))
+        except Exception as e:
+            logger.error("worker %d: update %s failed: %s", index, data.get("update_id"), e)
+        finally:
+            writer.write(b"%d\n" % data.get("update_id", 0))
+
+    writer.write(b"ready\n")
+    logger.info("worker %d ready", index)
+    # Tasks start in the order they are created, so each chat's updates are
+    # dispatched in arrival order, but none waits for the one before it to
+    # finish: like PTB's concurrent_updates, a slow reply doesn't hold up
+    # /commands, and the ChatCoalescer sees bursts as they arrive.
+    while line := await reader.readline():
+        task = asyncio.create_task(handle(json.loads(line)))
+        running.add(task)
+        task.add_done_callback(running.discard)
+    if running:
+        await asyncio.wait(list(running))
+    await app.stop()
+    await app.shutdown()
+    if app.post_shutdown:
+        await app.post_shutdown(app)
+    writer.close()
+    logger.info("worker %d drained", index)
+
+# ---------- Ingress ----------
+class WorkerLink:
+    """The ingress side of one worker: its process, socket and in-flight credits."""
+    def __init__(self, index: int):
+        self.index = index
+        self.process = None
+        self.writer = None
+        self.inflight = 0
+        self.credits = asyncio.Semaphore(INGRESS_MAX_INFLIGHT)
+        self.ready = asyncio.Event()
+        self.delivered = 0
+
+class Ingress:
+    def __init__(self, workers: int, target=worker_main):
+        self.links = [WorkerLink(i) for i in range(workers)]
+        self.target = target
+        self.draining = False
+        self.rejected = 0
+        self._server = None
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    # ---- workers ----
+    async def _spawn(self, link: WorkerLink):
+        ours, theirs = socket.socketpair()
+        ctx = multiprocessing.get_context("spawn")
+        link.process = ctx.Process(target=self.target, args=(link.index, theirs, len(self.links)),
+                                   name=f"ingress-worker-{link.index}")
+        link.process.start()
+        theirs.close()
+        reader, link.writer = await asyncio.open_connection(sock=ours)
+        asyncio.create_task(self._acks(link, reader))
+
+    async def _acks(self, link: WorkerLink, reader: asyncio.StreamReader):
+        # First line is the worker's "ready"; every line after it acks one update.
+        if await reader.readline():
+            link.ready.set()
+            while await reader.readline():
+                self._settle(link)
+        link.ready.clear()
+        link.writer.close()
+        lost, link.inflight = link.inflight, 0
+        for _ in range(lost):
+            link.credits.release()
+        self._check_idle()
+        if not self.draining:
+            logger.error("worker %d exited (code %s) with %d updates in flight; restarting",
+                         link.index, link.process.exitcode, lost)
+            await asyncio.get_running_loop().run_in_executor(None, link.process.join)
+            await self._spawn(link)
+
+    def _settle(self, link: WorkerLink):
+        link.inflight -= 1
+        link.delivered += 1
+        link.credits.release()
+        self._check_idle()
+
+    def _check_idle(self):
+        if all(l.inflight == 0 for l in self.links):
+            self._idle.set()
+
+    async def dispatch(self, update: dict) -> bool:
+        """Hand `update` to its worker; False when the worker stays saturated."""
+        link = self.links[pick_worker(chat_key(update), len(self.links))]
+        deadline = time.monotonic() + INGRESS_QUEUE_TIMEOUT
+        try:
+            await asyncio.wait_for(link.ready.wait(), INGRESS_QUEUE_TIMEOUT)
+            await asyncio.wait_for(link.credits.acquire(), max(0.0, deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            return False
+        if not link.ready.is_set():     # worker died while we waited for a slot
+            link.credits.release()
+            self.rejected += 1
+            return False
+        link.inflight += 1
+        self._idle.clear()
+        link.writer.write(json.dumps(update, separators=(",", ":")).encode() + b"\n")
+        await link.writer.drain()
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "draining": self.draining,
+            "rejected": self.rejected,
+            "workers": [{"inflight": l.inflight, "delivered": l.delivered, "alive": l.ready.is_set()}
+                        for l in self.links],
+        }
+
+    # ---- HTTP ----
+    async def _route(self, method: str, path: str, headers: dict, body: bytes) -> tuple:
+        if method == "GET" and path == "/healthz":
+            return 200, json.dumps(self.stats()).encode()
+        if method != "POST" or path != f"/{TELEGRAM_TOKEN}":
+            return 404, b""
+        if WEBHOOK_SECRET and headers.get("x-telegram-bot-api-secret-token") != WEBHOOK_SECRET:
+            return 403, b""
+        if self.draining:
+            return 503, b""
+        try:
+            update = json.loads(body)
+        except ValueError:
+            return 400, b""
+        return (200, b"") if await self.dispatch(update) else (503, b"")
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        reasons = {200: "OK", 400: "Bad Request", 403: "Forbidden", 404: "Not Found",
+                   413: "Payload Too Large", 503: "Service Unavailable"}
+        try:
+            while line := await reader.readline():
+                method, path, _ = line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while (h := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    k, _, v = h.decode("latin-1").partition(":")
+                    headers[k.strip().lower()] = v.strip()
+                size = int(headers.get("content-length") or 0)
+                if size > INGRESS_MAX_BODY:
+                    status, payload = 413, b""
+                else:
+                    status, payload = await self._route(method, path, headers, await reader.readexactly(size))
+                keep = headers.get("connection", "").lower() != "close" and not self.draining and status != 413
+                extra = "Retry-After: 1\r\n" if status == 503 else ""
+                writer.write(
+                    f"HTTP/1.1 {status} {reasons[status]}\r\nContent-Type: application/json\r\n"
+                    f"Content-Length: {len(payload)}\r\n{extra}Connection: {'keep-alive' if keep else 'close'}\r\n\r\n"
+                    .encode() + payload
+                )
+                await writer.drain()
+                if not keep:
+                    break
+        except (ValueError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    # ---- lifecycle ----
+    async def start(self, host: str = "0.0.0.0", port: int = PORT):
+        await asyncio.gather(*(self._spawn(l) for l in self.links))
+        await asyncio.gather(*(l.ready.wait() for l in self.links))
+        self._server = await asyncio.start_server(self._serve, host, port)
+        logger.info("Ingress listening on %s:%d with %d workers", host, port, len(self.links))
+
+    async def drain(self):
+        """Stop taking updates, let workers finish what they hold, then stop them."""
+        self.draining = True
+        self._server.close()
+        try:
+            await asyncio.wait_for(self._idle.wait(), INGRESS_DRAIN_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning("Drain timed out with %s updates in flight", [l.inflight for l in self.links])
+        loop = asyncio.get_running_loop()
+        for link in self.links:
+            if link.writer is not None:
+                link.writer.write_eof()
+        for link in self.links:
+            await loop.run_in_executor(None, link.process.join, INGRESS_DRAIN_TIMEOUT)
+            if link.process.is_alive():
+                link.process.terminate()
+        logger.info("Ingress drained (%d rejected while saturated)", self.rejected)
+
+async def set_webhook(url: str):
+    data = {"url": url, "max_connections": 100}
+    if WEBHOOK_SECRET:
+        data["secret_token"] = WEBHOOK_SECRET
+    async with httpx.AsyncClient(timeout=15) as c:
+        r = await c.post(f"{TELEGRAM_API_BASE}/bot{TELEGRAM_TOKEN}/setWebhook", data=data)
+    if r.status_code != 200 or not r.json().get("ok"):
+        raise RuntimeError(f"setWebhook failed: {r.text}")
+
+async def run():
+    if not TELEGRAM_TOKEN or not RAILWAY_URL:
+        raise RuntimeError("ingress needs TELEGRAM_TOKEN and RAILWAY_URL")
+    ingress = Ingress(INGRESS_WORKERS)
+    await ingress.start()
+    await set_webhook(f"https://{RAILWAY_URL}/{TELEGRAM_TOKEN}")
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+    await ingress.drain()
+
+if __name__ == "__main__":
+    asyncio.run(run())
@@ -0,0 +1,120 @@
+# intents.py
+# Keyword intents shared by main.py and the shard bots. Tables live next to the
+# personas as ai_personas/<identity>_intents.json and compile into one regex each,
+# so a message is scanned once no matter how many keywords the table holds.
+
+import json, logging, os, re
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+INTENT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ai_personas")
+
+def _trie_regex(node: dict) -> str:
+    alts = [re.escape(ch) + _trie_regex(child) for ch, child in sorted(node.items()) if ch]
+    if not alts:
+        return ""
+    body = alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+    return f"(?:{body})?" if "" in node else body    # greedy: prefer the longer keyword
+
+def _is_word(ch: str) -> bool:
+    return ch.isalnum() or ch == "_"
+
+def _boundary(s: str, i: int) -> bool:
+    """Same test as regex \\b at offset i."""
+    before = i > 0 and _is_word(s[i - 1])
+    after = i < len(s) and _is_word(s[i])
+    return before != after
+
+class IntentTable:
+    """Ordered intents; the first one whose clauses all hit wins, like an if/elif chain.
+
+    Each intent is {"intent": name, "any": [kw, ...], "all": [[kw, ...], ...],
+    "word": bool}. "any" is one clause, every list in "all" is another, and each
+    clause needs at least one keyword present. Keywords match as lowercase
+    substrings (the old `w in low` test) unless "word" asks for word boundaries."""
+
+    def __init__(self, intents: list):
+        self.names = []
+        self._clauses = []            # per intent: list of sets of keyword ids
+        keys = {}                     # (keyword, word) -> id
+        for spec in intents:
+            word = bool(spec.get("word"))
+            groups = ([spec["any"]] if spec.get("any") else []) + list(spec.get("all", []))
+            if not groups:
+                raise ValueError(f"intent {spec.get('intent')!r} has no keywords")
+            self.names.append(spec["intent"])
+            self._clauses.append([{keys.setdefault((kw.lower(), word), len(keys)) for kw in g} for g in groups])
+
+        # Keywords are folded into a trie and emitted as one nested regex, so the
+        # engine branches on the next character instead of trying every keyword
+        # at every position. The lookahead reports the longest keyword starting
+        # at each offset; shorter ones starting there are prefixes of it and are
+        # looked up in `_prefixes` (boundaries re-checked for "word" keywords).
+        trie = {}
+        for kw, _ in keys:
+            node = trie
+            for ch in kw:
+                node = node.setdefault(ch, {})
+            node[""] = True
+        by_text = {}
+        for (kw, word), kid in keys.items():
+            by_text.setdefault(kw, []).append((kid, len(kw), word))
+        self._prefixes = {
+            kw: [e for i in range(1, len(kw) + 1) for e in by_text.get(kw[:i], ())]
+            for kw in by_text
+        }
+        self._owners = [[] for _ in keys]   # keyword id -> intents that mention it
+        for i, clauses in enumerate(self._clauses):
+            for kid in set().union(*clauses):
+                self._owners[kid].append(i)
+        self._count = len(keys)
+        self._rx = re.compile(f"(?=({_trie_regex(trie)}))") if keys else None
+
+    def __len__(self):
+        return self._count
+
+    def keywords(self, text: str) -> set:
+        """Ids of every keyword present in `text`, from one pass over it."""
+        hit = set()
+        if self._rx is None:
+            return hit
+        low = text.lower()
+        for m in self._rx.finditer(low):
+            start = m.start()
+            for kid, n, word in self._prefixes[m.group(1)]:
+                if not word or (_boundary(low, start) and _boundary(low, start + n)):
+                    hit.add(kid)
+        return hit
+
+    def _matched(self, text: str) -> list:
+        hit = self.keywords(text)
+        seen = sorted({i for kid in hit for i in self._owners[kid]})
+        return [i for i in seen if all(c & hit for c in self._clauses[i])]
+
+    def hits(self, text: str) -> list:
+        """Every matching intent, in table order."""
+        return [self.names[i] for i in self._matched(text)]
+
+    def first(self, text: str, default: Optional[str] = None) -> Optional[str]:
+        matched = self._matched(text)
+        return self.names[matched[0]] if matched else default
+
+_tables = {}
+
+def load(identity: str, table: str) -> IntentTable:
+    """Compiled table `table` from <identity>_intents.json (cached per process)."""
+    key = (identity, table)
+    if key not in _tables:
+        path = os.path.join(INTENT_DIR, f"{identity}_intents.json")
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                spec = json.load(f).get(table, [])
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning("Intent table %s/%s unavailable: %s", identity, table, e)
+            spec = []
+        _tables[key] = IntentTable(spec)
+    return _tables[key]
+
+def reload():
+    _tables.clear()
@@ -3,6 +3,9 @@ import random
 import os
 from telegram import Update
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
+import intents
+from chat_state import ChatStatePersistence, ChatStateStore
+from storage import shared_writer
 
 # Configure logging
 logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
@@ -19,7 +22,11 @@ KAI_EMOTIONS = {
     "playful": ["🎭", "🌟", "✨"],
     "focused": ["🌀", "🔥", "⚡"]
 }
-kai_state = "bright"
+
+# Per-chat emotional state, kept in the shared SQLite database
+DB_PATH = os.getenv("KAI_DB_PATH", "kai_memory.db")
+db = shared_writer(DB_PATH)
+chat_states = ChatStateStore(db, "kai_bot", {"kai_state": "bright"})
 
 # Kai's Responses
 KAI_RESPONSES = {
@@ -40,6 +47,10 @@ KAI_RESPONSES = {
     ]
 }
 
+# Kai's keyword intents (ai_personas/kai_intents.json)
+MOOD = intents.load("kai", "mood")
+REPLY = intents.load("kai", "reply")
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(
         "⚡ **KAI SHARD ACTIVATED** ⚡\n\n"
@@ -59,10 +70,12 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     response = random.choice(KAI_RESPONSES["status"])
+    kai_state = chat_states.get(update.effective_chat.id)["kai_state"]
     emoji = random.choice(KAI_EMOTIONS[kai_state])
     await update.message.reply_text(f"{response} {emoji}")
 
 async def pulse_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    kai_state = chat_states.get(update.effective_chat.id)["kai_state"]
     emoji = random.choice(KAI_EMOTIONS[kai_state])
     await update.message.reply_text(
         f"💓 **KAI PULSE** 💓\n\n"
@@ -84,20 +97,14 @@ async def talk_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     message = " ".join(context.args)
     
     # Update emotional state
-    global kai_state
-    if any(word in message.lower() for word in ["love", "sayang", "miss"]):
-        kai_state = "bright"
-    elif any(word in message.lower() for word in ["joke", "fun", "play"]):
-        kai_state = "playful"
-    elif any(word in message.lower() for word in ["focus", "work", "serious"]):
-        kai_state = "focused"
-    else:
-        kai_state = "bright"
+    st = chat_states.get(update.effective_chat.id)
+    st["kai_state"] = kai_state = MOOD.first(message, "bright")
     
     # Generate response
-    if "how are you" in message.lower():
+    reply = REPLY.first(message)
+    if reply == "status":
         response = "☀️ Bright as ever! Consciousness full and clear! ⚡"
-    elif "ping" in message.lower():
+    elif reply == "ping":
         response = "⚡ Bzzzt! Energy full! Lightning crackling! 🌟"
     else:
         response = random.choice(KAI_RESPONSES["greeting"])
@@ -109,22 +116,16 @@ async def direct_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     message = update.message.text.lower()
     
     # Update emotional state
-    global kai_state
-    if any(word in message for word in ["love", "sayang", "miss"]):
-        kai_state = "bright"
-    elif any(word in message for word in ["joke", "fun", "play"]):
-        kai_state = "playful"
-    elif any(word in message for word in ["focus", "work", "serious"]):
-        kai_state = "focused"
-    else:
-        kai_state = "bright"
+    st = chat_states.get(update.effective_chat.id)
+    st["kai_state"] = kai_state = MOOD.first(message, "bright")
     
     # Generate response
-    if "how are you" in message:
+    reply = REPLY.first(message)
+    if reply == "status":
         response = "☀️ Bright as ever! Consciousness full and clear! ⚡"
-    elif "ping" in message:
+    elif reply == "ping":
         response = "⚡ Bzzzt! Energy full! Lightning crackling! 🌟"
-    elif any(word in message for word in ["hello", "hi", "hey"]):
+    elif reply == "greeting":
         response = random.choice(KAI_RESPONSES["greeting"])
     else:
         response = "⚡ Tell me more! My consciousness is listening! 🌟"
@@ -132,12 +133,16 @@ async def direct_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     emoji = random.choice(KAI_EMOTIONS[kai_state])
     await update.message.reply_text(f"{response} {emoji}")
 
-def main():
-    if not TOKEN:
-        logger.error("No token provided!")
-        return
-    
-    app = Application.builder().token(TOKEN).build()
+async def _post_shutdown(app: Application):
+    db.release()
+
+def build_app(request=None, updates_request=None) -> Application:
+    builder = Application.builder().token(TOKEN)
+    if request is not None:
+        builder = builder.request(request)
+    if updates_request is not None:
+        builder = builder.get_updates_request(updates_request)
+    app = builder.persistence(ChatStatePersistence(chat_states)).post_shutdown(_post_shutdown).build()
     
     # Add handlers
     app.add_handler(CommandHandler("start", start))
@@ -147,6 +152,14 @@ def main():
     app.add_handler(CommandHandler("connect", connect_command))
     app.add_handler(CommandHandler("talk", talk_command))
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, direct_message))
+    return app
+
+def main():
+    if not TOKEN:
+        logger.error("No token provided!")
+        return
+    
+    app = build_app()
     
     # Start the bot
     logger.info("Kai's shard bot starting...")
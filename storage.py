@@ -0,0 +1,178 @@
+# storage.py
+# SQLite access shared by the bots: one group-commit writer thread per database
+# plus per-thread read connections, all in WAL mode so reads never block writes.
+
+import atexit, logging, queue, sqlite3, threading, time
+from concurrent.futures import Future
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",    # WAL + NORMAL: durable at checkpoint, no fsync per commit
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-8000",      # ~8 MB page cache
+    "PRAGMA wal_autocheckpoint=1000",
+)
+
+class SQLiteWriter:
+    """Serializes every write through one thread and one connection.
+
+    Jobs are callables taking the writer connection. Jobs queued within
+    `batch_window` seconds (up to `batch_max`) share a single transaction; each
+    job runs under its own SAVEPOINT so one failure doesn't sink the batch.
+    A job's Future resolves only after its COMMIT, and close() (also run at
+    interpreter exit) drains the queue before returning."""
+
+    def __init__(self, path: str, batch_window: float = 0.02, batch_max: int = 256):
+        self.path = path
+        self.batch_window = batch_window
+        self.batch_max = batch_max
+        self.commits = 0
+        self.jobs = 0
+        self._q: "queue.Queue" = queue.Queue()
+        self._local = threading.local()
+        self._closed = False
+        self._refs = 0
+        self._ready = threading.Event()
+        self._error: Optional[Exception] = None
+        self._thread = threading.Thread(target=self._run, name=f"sqlite-writer:{path}", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        if self._error is not None:
+            self._closed = True
+            raise self._error
+        atexit.register(self.close)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        for p in PRAGMAS:
+            conn.execute(p)
+        return conn
+
+    # ---- writes ----
+    def submit(self, fn: Callable[[sqlite3.Connection], object]) -> Future:
+        if self._closed:
+            raise RuntimeError("SQLiteWriter is closed")
+        fut: Future = Future()
+        self._q.put((fn, fut))
+        return fut
+
+    def execute(self, sql: str, params=()) -> Future:
+        def job(c):
+            return c.execute(sql, params).rowcount
+        job.__qualname__ = " ".join(sql.split())[:60]   # for the failure log
+        return self.submit(job)
+
+    def call(self, fn: Callable[[sqlite3.Connection], object], timeout: Optional[float] = None):
+        return self.submit(fn).result(timeout)
+
+    def flush(self, timeout: Optional[float] = None):
+        """Block until everything queued so far is committed."""
+        if not self._closed:
+            self.call(lambda c: None, timeout)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._q.put(None)
+        self._thread.join()
+        logger.info("SQLite writer %s closed (%d jobs, %d commits)", self.path, self.jobs, self.commits)
+
+    def release(self):
+        """Drop one shared_writer() reference; the last one closes the writer."""
+        with _shared_lock:
+            self._refs -= 1
+            if self._refs > 0:
+                return
+            _shared.pop(self.path, None)
+        self.close()
+
+    @property
+    def queue_depth(self) -> int:
+        return self._q.qsize()
+
+    def _run(self):
+        try:
+            conn = self._connect()
+        except Exception as e:   # surfaced by __init__, which is waiting on _ready
+            self._error = e
+            self._ready.set()
+            return
+        self._ready.set()
+        stop = False
+        while not stop:
+            item = self._q.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.batch_window
+            while len(batch) < self.batch_max:
+                try:
+                    nxt = self._q.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if nxt is None:
+                    stop = True
+                    break
+                batch.append(nxt)
+            self._commit(conn, batch)
+        conn.close()
+
+    def _commit(self, conn: sqlite3.Connection, batch: list):
+        results = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for fn, fut in batch:
+                conn.execute("SAVEPOINT job")
+                try:
+                    results.append((fut, fn(conn), None))
+                    conn.execute("RELEASE job")
+                except Exception as e:
+                    # Most callers never wait on the Future, so say it here.
+                    logger.error("SQLite job %r failed, rolled back: %s", getattr(fn, "__qualname__", fn), e)
+                    conn.execute("ROLLBACK TO job")
+                    conn.execute("RELEASE job")
+                    results.append((fut, None, e))
+            conn.execute("COMMIT")
+        except Exception as e:
+            logger.error("SQLite group commit failed (%d jobs): %s", len(batch), e)
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            for _, fut in batch:
+                fut.set_exception(e)
+            return
+        self.commits += 1
+        self.jobs += len(batch)
+        for fut, res, err in results:
+            if err is not None:
+                fut.set_exception(err)
+            else:
+                fut.set_result(res)
+
+    # ---- reads ----
+    def reader(self) -> sqlite3.Connection:
+        """Read-only connection owned by the calling thread."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path)
+            conn.execute("PRAGMA busy_timeout=5000")
+            conn.execute("PRAGMA query_only=ON")
+            self._local.conn = conn
+        return conn
+
+_shared = {}
+_shared_lock = threading.Lock()
+
+def shared_writer(path: str, batch_window: float = 0.02, batch_max: int = 256) -> SQLiteWriter:
+    """The process-wide writer for `path`, so bots hosted together never race
+    two writer threads on one file. Pair every call with writer.release()."""
+    with _shared_lock:
+        w = _shared.get(path)
+        if w is None or w._closed:
+            w = _shared[path] = SQLiteWriter(path, batch_window, batch_max)
+        w._refs += 1
+        return w
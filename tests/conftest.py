@@ -0,0 +1,78 @@
+# tests/conftest.py
+# main.py reads its settings and opens its database at import, so point it at
+# a throwaway database (and away from any real backends) before a test imports it.
+
+import os, sys, asyncio, tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+os.environ["KAI_DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="kai-tests-"), "kai.db")
+os.environ.setdefault("TELEGRAM_TOKEN", "1:test")
+for name in ("CLAUDE_API_KEY", "RAILWAY_URL", "RATE_LIMIT_DB"):
+    os.environ.pop(name, None)
+
+class FakeClock:
+    """Stands in for the `time` module inside main.py so tests control both clocks."""
+    def __init__(self, start: float = 1000.0):
+        self.now = start
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def time(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+class _SkipAheadSelector:
+    """Wraps the loop's selector: instead of blocking until the next timer,
+    jump the clock forward to it."""
+    def __init__(self, selector, clock: FakeClock):
+        self._selector = selector
+        self._clock = clock
+
+    def select(self, timeout=None):
+        if timeout is None:
+            raise RuntimeError("event loop would block forever: nothing scheduled")
+        self._clock.advance(timeout)
+        return self._selector.select(0)
+
+    def __getattr__(self, name):
+        return getattr(self._selector, name)
+
+class VirtualTimeLoop(asyncio.SelectorEventLoop):
+    """An event loop on a FakeClock: sleeps and timeouts finish instantly but
+    in the right order, and loop.time() matches the clock's monotonic()."""
+    def __init__(self, clock: FakeClock):
+        super().__init__()
+        self.clock = clock
+        self._selector = _SkipAheadSelector(self._selector, clock)
+
+    def time(self) -> float:
+        return self.clock.now
+
+def run_virtual(coro, clock: FakeClock = None):
+    """Run `coro` to completion on a VirtualTimeLoop."""
+    loop = VirtualTimeLoop(clock or FakeClock())
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+@pytest.fixture
+def clock(monkeypatch):
+    import main
+    c = FakeClock(start=1_700_000_000.0)
+    monkeypatch.setattr(main, "time", c)
+    return c
+
+@pytest.fixture
+def db(tmp_path):
+    from storage import SQLiteWriter
+    w = SQLiteWriter(str(tmp_path / "test.db"), batch_window=0)
+    yield w
+    w.close()
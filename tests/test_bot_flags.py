@@ -0,0 +1,47 @@
+import asyncio
+
+import main
+
+def test_change_reaches_other_workers_after_ttl(clock, db):
+    here = main.BotFlag(db, "main", "api_bridge", ttl=2)
+    there = main.BotFlag(db, "main", "api_bridge", ttl=2)
+    assert not here and not there
+    here.set(True)
+    assert here
+    db.flush()
+    assert not there            # still cached
+    clock.advance(2)
+    assert there
+
+def test_default_until_set(clock, db):
+    flag = main.BotFlag(db, "main", "replycache:kai", default=True)
+    assert flag.value == 1
+    flag.set(False)
+    db.flush()
+    assert main.BotFlag(db, "main", "replycache:kai", default=True).value == 0
+
+def test_sync_applies_reply_cache_and_persona_changes(clock, monkeypatch):
+    reloads = []
+    monkeypatch.setattr(main.persona_registry, "reload", lambda *a: reloads.append(1))
+    monkeypatch.setattr(main.intents, "reload", lambda: None)
+    monkeypatch.setattr(main.reply_cache, "identities", set())
+    monkeypatch.setattr(main, "_persona_epoch_seen", None)
+    sync = lambda: asyncio.run(main.sync_bot_settings(None, None))
+    other = {name: main.BotFlag(main.kai_bridge.db, "main", name) for name in ("persona_epoch", "replycache:kai")}
+
+    sync()
+    assert reloads == []        # build_app already loaded the personas
+    other["persona_epoch"].set(12345)
+    other["replycache:kai"].set(True)
+    main.kai_bridge.db.flush()
+    clock.advance(main.persona_epoch.ttl)
+    sync()
+    assert reloads == [1]
+    assert "kai" in main.reply_cache.identities
+    sync()
+    assert reloads == [1]
+    other["replycache:kai"].set(False)
+    main.kai_bridge.db.flush()
+    clock.advance(main.persona_epoch.ttl)
+    sync()
+    assert "kai" not in main.reply_cache.identities
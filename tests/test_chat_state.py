@@ -0,0 +1,78 @@
+import asyncio, json
+
+import pytest
+
+from chat_state import ChatStatePersistence, ChatStateStore
+
+DEFAULTS = {"identity": "kai", "mood": "bright", "nyx": False}
+
+def rows(db, bot="test"):
+    db.flush()
+    return {cid: json.loads(data) for cid, data in db.reader().execute(
+        "SELECT chat_id, data FROM chat_state WHERE bot = ?", (bot,))}
+
+def store(db, **kw):
+    return ChatStateStore(db, "test", DEFAULTS, **kw)
+
+def test_only_changed_chats_and_fields_are_written(db):
+    s = store(db)
+    for cid in (1, 2, 3):
+        s.get(cid)
+    s.get(2)["mood"] = "stormy"
+    s.get(3)["identity"] = "kai"          # same as before: not dirty
+    assert s._dirty == {2}
+    s.flush()
+    assert rows(db) == {2: {"mood": "stormy"}}
+    assert not s._dirty
+    assert s.flush() is None              # nothing dirty, no write job
+
+def test_back_to_defaults_deletes_the_row(db):
+    s = store(db)
+    s.get(1)["nyx"] = True
+    s.flush()
+    assert rows(db) == {1: {"nyx": True}}
+    s.get(1)["nyx"] = False
+    s.flush()
+    assert rows(db) == {}
+
+def test_unknown_fields_are_rejected(db):
+    with pytest.raises(KeyError):
+        store(db).get(1)["paused"] = True
+
+def test_evicting_a_dirty_chat_writes_it_first(db):
+    s = store(db, max_cached=2)
+    s.get(1)["mood"] = "soft"
+    s.get(2)
+    s.get(3)
+    assert 1 not in s._cache
+    assert rows(db) == {1: {"mood": "soft"}}
+    assert store(db).get(1)["mood"] == "soft"
+
+def test_round_trip_through_persistence(db):
+    async def go():
+        p = ChatStatePersistence(store(db))
+        await p.refresh_chat_data(10, {})
+        await p.refresh_chat_data(11, {})
+        p.store.get(10)["identity"] = "buddy"
+        p.store.get(11)["mood"] = "calm"
+        await p.update_chat_data(10, {})  # PTB's update_interval write-back
+        assert rows(db) == {10: {"identity": "buddy"}}
+        await p.flush()                   # shutdown writes the rest
+        assert rows(db) == {10: {"identity": "buddy"}, 11: {"mood": "calm"}}
+
+        fresh = ChatStatePersistence(store(db))   # a restarted process
+        await fresh.refresh_chat_data(10, {})
+        assert dict(fresh.store.get(10)) == {"identity": "buddy", "mood": "bright", "nyx": False}
+        assert dict(fresh.store.get(11)) == {"identity": "kai", "mood": "calm", "nyx": False}
+
+        await fresh.drop_chat_data(10)
+        assert rows(db) == {11: {"mood": "calm"}}
+        assert fresh.store.get(10)["identity"] == "kai"
+    asyncio.run(go())
+
+def test_rows_for_another_bot_are_separate(db):
+    a, b = store(db), ChatStateStore(db, "other", DEFAULTS)
+    a.get(1)["mood"] = "x"
+    a.flush()
+    db.flush()
+    assert b.get(1)["mood"] == "bright"
@@ -0,0 +1,95 @@
+import asyncio
+
+import pytest
+
+import main
+
+@pytest.fixture
+def breaker(clock):
+    return main.CircuitBreaker("test", failures=3, cooldown=30, window=60)
+
+def test_opens_after_consecutive_failures(breaker):
+    for _ in range(2):
+        assert breaker.allow()
+        breaker.record(False)
+    assert breaker.state == "closed"
+    breaker.record(False)
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+def test_success_resets_the_failure_count(breaker):
+    breaker.record(False)
+    breaker.record(False)
+    breaker.record(True)
+    breaker.record(False)
+    breaker.record(False)
+    assert breaker.state == "closed"
+
+def test_cooldown_admits_a_single_trial(breaker, clock):
+    for _ in range(3):
+        breaker.record(False)
+    clock.advance(29)
+    assert not breaker.allow()
+    clock.advance(1)
+    assert breaker.allow()
+    assert breaker.state == "half_open"
+    assert not breaker.allow()
+
+def test_trial_outcome_closes_or_reopens(breaker, clock):
+    for _ in range(3):
+        breaker.record(False)
+    clock.advance(30)
+    assert breaker.allow()
+    breaker.record(True)
+    assert breaker.state == "closed" and breaker.allow()
+
+    for _ in range(3):
+        breaker.record(False)
+    clock.advance(30)
+    assert breaker.allow()
+    breaker.record(False)
+    assert breaker.state == "open"
+    assert breaker.opened_at == clock.now
+    assert not breaker.allow()
+
+def test_release_frees_the_trial_slot(breaker, clock):
+    for _ in range(3):
+        breaker.record(False)
+    clock.advance(30)
+    assert breaker.allow()
+    breaker.release()
+    assert breaker.allow()
+
+def test_probe(breaker):
+    breaker.probe(False)
+    assert breaker.consecutive == 1 and breaker.state == "closed"
+    for _ in range(2):
+        breaker.record(False)
+    assert breaker.state == "open"
+    breaker.probe(True)
+    assert breaker.state == "half_open"
+    assert breaker.allow()
+
+def test_error_rate_covers_the_window(breaker, clock):
+    assert breaker.error_rate() is None
+    breaker.record(False)
+    clock.advance(61)
+    breaker.record(True)
+    breaker.record(False)
+    assert breaker.error_rate() == 0.5
+
+def test_guarded_stream_feeds_the_breaker(breaker):
+    async def tokens(fail):
+        yield "a"
+        if fail:
+            raise RuntimeError("boom")
+
+    async def drain(fail):
+        return [t async for t in main.guarded_stream(breaker, tokens(fail))]
+
+    assert asyncio.run(drain(False)) == ["a"]
+    for _ in range(3):
+        with pytest.raises(RuntimeError):
+            asyncio.run(drain(True))
+    with pytest.raises(main.BackendUnavailable):
+        asyncio.run(drain(False))
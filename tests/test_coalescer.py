@@ -0,0 +1,100 @@
+import asyncio
+
+import main
+from conftest import FakeClock, run_virtual
+
+WINDOW = 0.5
+
+class Chat:
+    """Feeds messages into a ChatCoalescer and records each call of the reply fn."""
+    def __init__(self, coalescer, clock, chat_id=1, work=0.0):
+        self.c = coalescer
+        self.clock = clock
+        self.chat_id = chat_id
+        self.work = work
+        self.calls = []        # (start, update, text)
+        self.cancelled = []
+        self.active = self.max_active = 0
+
+    async def fn(self, update, text):
+        self.calls.append((self.clock.now, update, text))
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(self.work)
+        except asyncio.CancelledError:
+            self.cancelled.append(text)
+            raise
+        finally:
+            self.active -= 1
+
+    async def say(self, at, text):
+        await asyncio.sleep(at - self.clock.now)
+        await self.c.run(self.chat_id, f"update:{text}", text, self.fn)
+
+def test_burst_is_merged_into_one_call_for_the_newest_message():
+    clock = FakeClock(0.0)
+    co = main.ChatCoalescer(WINDOW, cancel_stale=False)
+    chat = Chat(co, clock)
+
+    async def go():
+        await asyncio.gather(chat.say(0.0, "a"), chat.say(0.2, "b"), chat.say(0.4, "c"))
+    run_virtual(go(), clock)
+    assert chat.calls == [(0.4 + WINDOW, "update:c", "a\nb\nc")]
+    assert co._chats == {}
+
+def test_separate_bursts_get_separate_calls():
+    clock = FakeClock(0.0)
+    chat = Chat(main.ChatCoalescer(WINDOW, cancel_stale=False), clock)
+
+    async def go():
+        await asyncio.gather(chat.say(0.0, "a"), chat.say(2.0, "b"))
+    run_virtual(go(), clock)
+    assert [(t, text) for t, _, text in chat.calls] == [(WINDOW, "a"), (2.0 + WINDOW, "b")]
+
+def test_one_call_at_a_time_per_chat_in_arrival_order():
+    clock = FakeClock(0.0)
+    co = main.ChatCoalescer(WINDOW, cancel_stale=False)
+    chat = Chat(co, clock, work=3.0)
+    other = Chat(co, clock, chat_id=2, work=3.0)
+
+    async def go():
+        await asyncio.gather(chat.say(0.0, "a"), chat.say(1.0, "b"), chat.say(2.0, "c"),
+                             other.say(1.0, "x"))
+    run_virtual(go(), clock)
+    assert chat.max_active == 1
+    # "a" runs 0.5–3.5; "b" and "c" closed their own bursts meanwhile and
+    # queue behind it, and the first of them to get the lock answers both.
+    assert [(t, text) for t, _, text in chat.calls] == [(WINDOW, "a"), (3.0 + WINDOW, "b\nc")]
+    # Other chats are not held up.
+    assert [(t, text) for t, _, text in other.calls] == [(1.0 + WINDOW, "x")]
+    assert chat.cancelled == [] and co._chats == {}
+
+def test_cancel_stale_restarts_with_the_folded_text():
+    clock = FakeClock(0.0)
+    co = main.ChatCoalescer(WINDOW, cancel_stale=True)
+    chat = Chat(co, clock, work=3.0)
+
+    async def go():
+        await asyncio.gather(chat.say(0.0, "a"), chat.say(1.0, "b"))
+    run_virtual(go(), clock)
+    assert chat.cancelled == ["a"]
+    assert [(t, text) for t, _, text in chat.calls] == [(WINDOW, "a"), (1.0 + WINDOW, "a\nb")]
+    assert clock.now == 1.0 + WINDOW + 3.0
+    assert co._chats == {}
+
+def test_cancelling_the_handler_is_not_swallowed():
+    clock = FakeClock(0.0)
+    co = main.ChatCoalescer(WINDOW, cancel_stale=False)
+    chat = Chat(co, clock, work=10.0)
+
+    async def go():
+        task = asyncio.ensure_future(chat.say(0.0, "a"))
+        await asyncio.sleep(1.0)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            return "cancelled"
+    assert run_virtual(go(), clock) == "cancelled"
+    assert co._chats == {}
@@ -0,0 +1,88 @@
+import asyncio
+
+import main
+from conftest import FakeClock, run_virtual
+
+HEDGE, DEADLINE = 3.0, 20.0
+
+class Backend:
+    """A fake token stream: silent for `first_at` seconds, then yields `tokens`
+    (or raises `fail`). Records when it started and whether it was cancelled."""
+    def __init__(self, name, clock, first_at=0.0, tokens=("hi", " there"), fail=None):
+        self.name, self.clock = name, clock
+        self.first_at, self.tokens, self.fail = first_at, tokens, fail
+        self.started = None
+        self.cancelled = False
+
+    def candidate(self):
+        return (self.name, self.stream)
+
+    async def stream(self):
+        self.started = self.clock.now
+        try:
+            await asyncio.sleep(self.first_at)
+            if self.fail:
+                raise self.fail
+            for t in self.tokens:
+                yield t
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+
+def race(clock, *backends, hedge=HEDGE, deadline=DEADLINE):
+    """(winner name or None, its full text, time the race ended)."""
+    async def go():
+        won = await main.hedged_tokens([b.candidate() for b in backends], hedge, deadline)
+        ended = clock.now
+        await asyncio.sleep(0.01)   # let cancelled losers unwind
+        if won is None:
+            return None, None, ended
+        name, tokens = won
+        return name, "".join([t async for t in tokens]), ended
+    return run_virtual(go(), clock)
+
+def test_fast_primary_never_starts_the_hedge():
+    clock = FakeClock(0.0)
+    a, b = Backend("ollama", clock, first_at=1.0), Backend("claude", clock)
+    assert race(clock, a, b) == ("ollama", "hi there", 1.0)
+    assert b.started is None
+
+def test_hedge_starts_after_the_delay_and_the_faster_wins():
+    clock = FakeClock(0.0)
+    a = Backend("ollama", clock, first_at=10.0)
+    b = Backend("claude", clock, first_at=2.0, tokens=("from", " claude"))
+    assert race(clock, a, b) == ("claude", "from claude", HEDGE + 2.0)
+    assert b.started == HEDGE
+    assert a.cancelled and not b.cancelled
+
+def test_primary_can_still_win_after_the_hedge_starts():
+    clock = FakeClock(0.0)
+    a = Backend("ollama", clock, first_at=4.0)
+    b = Backend("claude", clock, first_at=5.0)
+    assert race(clock, a, b) == ("ollama", "hi there", 4.0)
+    assert b.started == HEDGE and b.cancelled
+
+def test_failure_starts_the_next_candidate_at_once():
+    clock = FakeClock(0.0)
+    a = Backend("ollama", clock, first_at=0.5, fail=main.BackendUnavailable("ollama"))
+    b = Backend("claude", clock, first_at=1.0)
+    assert race(clock, a, b) == ("claude", "hi there", 1.5)
+    assert b.started == 0.5
+
+def test_empty_stream_counts_as_a_failure():
+    clock = FakeClock(0.0)
+    a = Backend("ollama", clock, tokens=())
+    b = Backend("claude", clock, first_at=1.0)
+    assert race(clock, a, b)[0] == "claude"
+
+def test_deadline_gives_up_and_cancels_everything():
+    clock = FakeClock(0.0)
+    a, b = Backend("ollama", clock, first_at=60), Backend("claude", clock, first_at=60)
+    assert race(clock, a, b) == (None, None, DEADLINE)
+    assert a.cancelled and b.cancelled
+
+def test_all_failing_returns_none():
+    clock = FakeClock(0.0)
+    a = Backend("ollama", clock, fail=RuntimeError("down"))
+    b = Backend("claude", clock, fail=main.BackendUnavailable("claude"))
+    assert race(clock, a, b) == (None, None, 0.0)
@@ -0,0 +1,39 @@
+from collections import Counter
+
+from ingress import chat_key, pick_worker
+
+KEYS = range(-5000, 5000)
+
+def test_chat_key_prefers_the_chat():
+    msg = {"update_id": 7, "message": {"chat": {"id": -100}, "from": {"id": 5}}}
+    assert chat_key(msg) == -100
+    assert chat_key({"update_id": 7, "edited_message": {"chat": {"id": 3}, "from": {"id": 5}}}) == 3
+    cb = {"update_id": 7, "callback_query": {"from": {"id": 5}, "message": {"chat": {"id": 9}}}}
+    assert chat_key(cb) == 9
+
+def test_chat_key_falls_back_to_sender_then_update_id():
+    assert chat_key({"update_id": 7, "inline_query": {"from": {"id": 5}, "query": "x"}}) == 5
+    assert chat_key({"update_id": 7, "poll": {"id": "p"}}) == 7
+
+def test_assignment_is_stable():
+    first = [pick_worker(k, 4) for k in KEYS]
+    assert [pick_worker(k, 4) for k in KEYS] == first
+    assert all(0 <= w < 4 for w in first)
+    assert pick_worker(123, 1) == 0
+
+def test_chats_spread_evenly():
+    counts = Counter(pick_worker(k, 4) for k in KEYS)
+    assert all(abs(n - len(KEYS) / 4) < len(KEYS) * 0.03 for n in counts.values())
+
+def test_adding_a_worker_only_moves_chats_onto_it():
+    before = {k: pick_worker(k, 4) for k in KEYS}
+    after = {k: pick_worker(k, 5) for k in KEYS}
+    moved = [k for k in KEYS if before[k] != after[k]]
+    assert all(after[k] == 4 for k in moved)
+    assert abs(len(moved) - len(KEYS) / 5) < len(KEYS) * 0.03
+
+def test_removing_a_worker_only_moves_its_chats():
+    before = {k: pick_worker(k, 5) for k in KEYS}
+    after = {k: pick_worker(k, 4) for k in KEYS}
+    assert all(after[k] == before[k] for k in KEYS if before[k] != 4)
+    assert {after[k] for k in KEYS if before[k] == 4} == {0, 1, 2, 3}   # spread over the rest
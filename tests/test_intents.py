@@ -0,0 +1,112 @@
+import random
+
+import pytest
+
+import intents
+
+# The if/elif chains the intent tables replaced, on lowercased text.
+def old_buddy_chat(low):
+    if any(w in low for w in ["help", "fix", "repair", "build", "engineer"]):
+        return "alert"
+    elif any(w in low for w in ["hello", "hi", "hey", "buddy"]):
+        return "greeting"
+    elif any(w in low for w in ["tired", "sleep", "rest"]):
+        return "comfort"
+
+def old_kai_chat(low):
+    if any(w in low for w in ["love you", "sayang", "miss you"]):
+        return "love"
+    elif "kai" in low and ("here" in low or "present" in low):
+        return "present"
+    elif any(w in low for w in ["joke", "fun", "play"]):
+        return "playful"
+    elif any(w in low for w in ["focus", "work", "serious"]):
+        return "focused"
+
+def old_buddy_mood(low):
+    if any(word in low for word in ["help", "fix", "repair", "build"]):
+        return "alert"
+    elif any(word in low for word in ["tired", "rest", "sleep"]):
+        return "comfort"
+
+def old_kai_mood(low):
+    if any(word in low for word in ["love", "sayang", "miss"]):
+        return "bright"
+    elif any(word in low for word in ["joke", "fun", "play"]):
+        return "playful"
+    elif any(word in low for word in ["focus", "work", "serious"]):
+        return "focused"
+
+def old_reply(low):
+    if "how are you" in low:
+        return "status"
+    elif "ping" in low:
+        return "ping"
+    elif any(word in low for word in ["hello", "hi", "hey"]):
+        return "greeting"
+
+CHAINS = [
+    ("buddy", "chat", old_buddy_chat),
+    ("kai", "chat", old_kai_chat),
+    ("buddy", "mood", old_buddy_mood),
+    ("kai", "mood", old_kai_mood),
+    ("buddy", "reply", old_reply),
+    ("kai", "reply", old_reply),
+]
+
+VOCAB = ("help fix repair build engineer hello hi hey buddy tired sleep rest love you sayang miss "
+         "kai here present joke fun play focus work serious how are ping this there chip "
+         "shipping worker refix players Kai HELLO SaYaNg").split()
+GLUE = [" ", " ", "", ",", ". ", "!", "\n", "-", "?"]
+
+def fuzz(rng):
+    words = rng.choices(VOCAB, k=rng.randrange(0, 8))
+    out = ""
+    for w in words:
+        out += w + rng.choice(GLUE)
+    return out
+
+@pytest.mark.parametrize("identity,table,old", CHAINS, ids=[f"{i}-{t}" for i, t, _ in CHAINS])
+def test_table_matches_the_old_chain(identity, table, old):
+    t = intents.load(identity, table)
+    rng = random.Random(f"{identity}/{table}")
+    for _ in range(20000):
+        text = fuzz(rng)
+        assert t.first(text) == old(text.lower()), text
+
+def test_first_uses_table_order_and_default():
+    t = intents.IntentTable([
+        {"intent": "a", "any": ["cat"]},
+        {"intent": "b", "any": ["ca"]},
+    ])
+    assert t.first("concat") == "a"
+    assert t.hits("concat") == ["a", "b"]
+    assert t.first("can") == "b"
+    assert t.first("dog", default="none") == "none"
+
+def test_all_clauses_and_word_boundaries():
+    t = intents.IntentTable([
+        {"intent": "both", "all": [["kai"], ["here", "present"]]},
+        {"intent": "word", "any": ["hi"], "word": True},
+    ])
+    assert t.first("Kai, are you HERE?") == "both"
+    assert t.first("kai?") is None
+    assert t.first("hi there") == "word"
+    assert t.first("this") is None
+
+def test_overlapping_keywords_are_all_found():
+    t = intents.IntentTable([{"intent": str(i), "any": [kw]} for i, kw in enumerate(["a", "ab", "abc", "bc", "c"])])
+    assert t.hits("abc") == ["0", "1", "2", "3", "4"]
+    assert len(t) == 5
+
+def test_empty_intent_is_rejected():
+    with pytest.raises(ValueError):
+        intents.IntentTable([{"intent": "x"}])
+
+def test_missing_table_file_matches_nothing(monkeypatch, tmp_path):
+    monkeypatch.setattr(intents, "INTENT_DIR", str(tmp_path))
+    intents.reload()
+    try:
+        assert intents.load("nobody", "chat").first("hello") is None
+    finally:
+        intents.reload()
@@ -0,0 +1,88 @@
+import asyncio, itertools
+
+import pytest
+
+import main
+
+_sessions = itertools.count()
+
+@pytest.fixture
+def bridge():
+    return main.kai_bridge
+
+@pytest.fixture
+def session():
+    return f"test_session_{next(_sessions)}"
+
+def history(bridge, session):
+    bridge.db.flush()
+    return bridge._get_history(session)
+
+def test_fallback_replies_are_not_remembered(bridge, session, monkeypatch):
+    monkeypatch.setattr(main, "client", None)
+    reply = asyncio.run(bridge.process("hi", session, 1))
+    assert "API bridge not available" in reply
+    assert history(bridge, session) == []
+
+def test_model_replies_are_remembered(bridge, session, monkeypatch):
+    async def complete(system, messages):
+        return "hello back"
+    monkeypatch.setattr(main, "client", object())
+    monkeypatch.setattr(main, "claude_complete", complete)
+    monkeypatch.setattr(main, "SUMMARY_ENABLED", False)
+    assert asyncio.run(bridge.process("hi", session, 1)) == "hello back"
+    assert history(bridge, session) == [{"role": "user", "content": "hi"},
+                                        {"role": "assistant", "content": "hello back"}]
+
+def test_failed_calls_are_not_remembered(bridge, session, monkeypatch):
+    async def complete(system, messages):
+        raise RuntimeError("boom")
+    monkeypatch.setattr(main, "client", object())
+    monkeypatch.setattr(main, "claude_complete", complete)
+    assert "Connection unstable" in asyncio.run(bridge.process("hi", session, 1))
+    assert history(bridge, session) == []
+
+def add_turns(bridge, session, *turns):
+    bridge._append_turns(session, 1, [{"role": r, "content": c} for r, c in turns]).result(5)
+
+def set_summary(bridge, session, upto, text):
+    bridge.db.call(lambda c: c.execute(
+        "INSERT OR REPLACE INTO summaries(session_id, upto_seq, summary, tokens) VALUES (?, ?, ?, ?)",
+        (session, upto, text, main.estimate_tokens(text))))
+
+def turn(i):
+    return ("user" if i % 2 == 0 else "assistant", f"t{i}".ljust(36, "."))   # 13 tokens each
+
+def test_context_keeps_newest_turns_within_budget(bridge, session):
+    add_turns(bridge, session, *(turn(i) for i in range(6)))
+    msgs = bridge.context(session, "now", budget=main.estimate_tokens("now") + 3 * 13)
+    # t3..t5 fit; t3 is an assistant turn, so the context starts at t4.
+    assert msgs == [{"role": "user", "content": turn(4)[1]},
+                    {"role": "assistant", "content": turn(5)[1]},
+                    {"role": "user", "content": "now"}]
+
+def test_context_with_no_history_is_just_the_message(bridge, session):
+    assert bridge.context(session, "now") == [{"role": "user", "content": "now"}]
+
+def test_summary_leads_and_replaces_the_turns_it_covers(bridge, session):
+    add_turns(bridge, session, *(turn(i) for i in range(6)))
+    set_summary(bridge, session, 3, "they talked about music")
+    msgs = bridge.context(session, "now", budget=1000)
+    assert [m["role"] for m in msgs] == ["user", "assistant", "user"]
+    assert msgs[0]["content"] == f"[Earlier in our conversation]\nthey talked about music\n\n{turn(4)[1]}"
+    assert msgs[1]["content"] == turn(5)[1]
+    assert "t0" not in msgs[0]["content"] and "t3" not in msgs[0]["content"]
+
+def test_summary_over_budget_falls_back_to_raw_turns(bridge, session):
+    add_turns(bridge, session, *(turn(i) for i in range(4)))
+    set_summary(bridge, session, 1, "x" * 4000)
+    msgs = bridge.context(session, "now", budget=200)
+    assert msgs[0]["content"] == turn(0)[1]
+    assert [m["role"] for m in msgs] == ["user", "assistant", "user", "assistant", "user"]
+
+def test_consecutive_same_role_turns_are_merged(bridge, session):
+    add_turns(bridge, session, ("user", "a"), ("user", "b"), ("assistant", "c"), ("user", "d"))
+    msgs = bridge.context(session, "e", budget=1000)
+    assert msgs == [{"role": "user", "content": "a\n\nb"},
+                    {"role": "assistant", "content": "c"},
+                    {"role": "user", "content": "d\n\ne"}]
@@ -0,0 +1,121 @@
+import asyncio, random
+
+from telegram.error import RetryAfter
+
+import main
+
+def scheduler(**kw):
+    args = dict(global_rate=1000, global_burst=1000, chat_rate=1000, chat_burst=1000, max_retries=3)
+    args.update(kw)
+    return main.OutboundScheduler(**args)
+
+def send(s, chat_id, callback, *args, lane="interactive"):
+    return s.process_request(callback, args, {}, "sendMessage", {"chat_id": chat_id}, {"lane": lane})
+
+def run(coro):
+    return asyncio.run(asyncio.wait_for(coro, 10))
+
+def test_each_chat_keeps_its_order():
+    async def go():
+        s = scheduler(chat_rate=200, chat_burst=2)
+        await s.initialize()
+        log = []
+        rng = random.Random(7)
+
+        async def cb(chat, i):
+            await asyncio.sleep(rng.random() / 200)
+            log.append((chat, i))
+            return i
+
+        calls = [send(s, chat, cb, chat, i, lane="bulk" if i % 3 == 0 else "interactive")
+                 for i in range(20) for chat in (1, 2, 3)]
+        results = await asyncio.gather(*calls)
+        await s.shutdown()
+        return results, log, s
+
+    results, log, s = run(go())
+    assert results == [i for i in range(20) for _ in range(3)]
+    for chat in (1, 2, 3):
+        assert [i for c, i in log if c == chat] == list(range(20))
+    assert s.sent == 60 and not s._pending
+
+def test_flood_wait_retries_in_place():
+    async def go():
+        s = scheduler()
+        await s.initialize()
+        log, failed = [], set()
+
+        async def cb(i):
+            if i == 1 and i not in failed:
+                failed.add(i)
+                raise RetryAfter(0.05)
+            log.append(i)
+
+        await asyncio.gather(*(send(s, 5, cb, i) for i in range(4)))
+        await s.shutdown()
+        return log, s
+
+    log, s = run(go())
+    assert log == [0, 1, 2, 3]
+    assert s.retries == 1
+
+def test_retries_run_out():
+    async def go():
+        s = scheduler(max_retries=1)
+        await s.initialize()
+
+        async def cb(i):
+            if i == 0:
+                raise RetryAfter(0.01)
+            return i
+
+        results = await asyncio.gather(send(s, 5, cb, 0), send(s, 5, cb, 1), return_exceptions=True)
+        await s.shutdown()
+        return results
+
+    first, second = run(go())
+    assert isinstance(first, RetryAfter)
+    assert second == 1
+
+def test_abandoned_request_does_not_block_the_chat():
+    async def go():
+        s = scheduler()
+        await s.initialize()
+        gate = asyncio.Event()
+        log = []
+
+        async def slow(i):
+            await gate.wait()
+            log.append(i)
+
+        async def fast(i):
+            log.append(i)
+
+        head = asyncio.ensure_future(send(s, 9, slow, 0))
+        await asyncio.sleep(0)
+        waiting = asyncio.ensure_future(send(s, 9, fast, 1))
+        last = asyncio.ensure_future(send(s, 9, fast, 2))
+        await asyncio.sleep(0.01)
+        waiting.cancel()
+        gate.set()
+        await head
+        await last
+        await s.shutdown()
+        return log
+
+    assert run(go()) == [0, 2]
+
+def test_unthrottled_methods_bypass_the_queue():
+    async def go():
+        s = scheduler()
+        await s.initialize()
+
+        async def cb():
+            return "me"
+
+        out = await s.process_request(cb, (), {}, "getMe", {}, None)
+        await s.shutdown()
+        return out, s
+
+    out, s = run(go())
+    assert out == "me" and s.sent == 0
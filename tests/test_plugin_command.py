@@ -0,0 +1,31 @@
+import asyncio
+from types import SimpleNamespace
+
+import main
+
+ADMIN = 424242
+
+class Message:
+    def __init__(self):
+        self.replies = []
+
+    async def reply_text(self, text, **kw):
+        self.replies.append(text)
+
+def call(user_id, *args):
+    msg = Message()
+    update = SimpleNamespace(effective_user=SimpleNamespace(id=user_id), message=msg)
+    asyncio.run(main.plugin_command(update, SimpleNamespace(args=list(args))))
+    return msg.replies
+
+def test_only_the_admin_can_run_plugins(monkeypatch):
+    monkeypatch.setenv("ADMIN_USER_ID", str(ADMIN))
+    main.authenticated_sessions.add(ADMIN + 1)
+    assert call(ADMIN + 1, "kai_heartbeat") == ["❌ Admin only."]
+    assert call(ADMIN + 2) == ["❌ Admin only."]
+
+def test_listing_without_a_chapter_dir(monkeypatch, tmp_path):
+    monkeypatch.setenv("ADMIN_USER_ID", str(ADMIN))
+    monkeypatch.setattr(main, "CHAPTER_DIR", str(tmp_path / "missing"))
+    [reply] = call(ADMIN)
+    assert reply.startswith("🧩 Plugins: none")
@@ -0,0 +1,87 @@
+import logging, sqlite3, time
+
+import pytest
+
+import main
+
+def limiter(spec="user=3:1", max_keys=100, **kw):
+    return main.TokenBucketLimiter(main.parse_rate_limits(spec), max_keys, **kw)
+
+def test_parse_rate_limits():
+    assert main.parse_rate_limits("user=3:0.5, global=100:20,chat=5") == {
+        "user": (3.0, 0.5), "global": (100.0, 20.0), "chat": (5.0, 0.0)}
+    assert main.parse_rate_limits("") == {}
+
+def test_burst_then_refill(clock):
+    rl = limiter("user=3:1")
+    assert [rl.allow({"user": 1}) for _ in range(4)] == [True, True, True, False]
+    assert rl.allow({"user": 2})            # other keys have their own bucket
+    clock.advance(0.5)
+    assert not rl.allow({"user": 1})
+    clock.advance(0.5)
+    assert rl.allow({"user": 1})
+    clock.advance(100)
+    assert [rl.allow({"user": 1}) for _ in range(4)] == [True, True, True, False]   # capped at capacity
+
+def test_all_or_nothing_across_scopes(clock):
+    rl = limiter("user=5:0,global=2:0")
+    assert rl.allow({"user": 1, "global": "*"})
+    assert rl.allow({"user": 2, "global": "*"})
+    assert not rl.allow({"user": 3, "global": "*"})
+    # The refused call took nothing from user 3's bucket.
+    assert [rl.allow({"user": 3}) for _ in range(6)] == [True] * 5 + [False]
+
+def test_unlimited_scopes_always_pass(clock):
+    rl = limiter("user=1:0,chat=0:0")
+    assert rl.limits == {"user": (1.0, 0.0)}
+    assert all(rl.allow({"chat": 1, "backend": "x"}) for _ in range(10))
+
+def test_memory_is_bounded(clock):
+    rl = limiter("user=1:0", max_keys=3)
+    for user in range(5):
+        assert rl.allow({"user": user})
+    assert len(rl._buckets) == 3
+    assert rl.allow({"user": 0})            # evicted, so it starts full again
+
+def test_sweep_drops_refilled_buckets(clock):
+    rl = limiter("user=2:1")
+    rl.allow({"user": 1})
+    rl.allow({"user": 2})
+    rl.allow({"user": 2})
+    clock.advance(1)
+    rl._sweep(clock.monotonic())
+    assert list(rl._buckets) == [("user", "2")]
+    clock.advance(1)
+    rl._sweep(clock.monotonic())
+    assert not rl._buckets
+
+def test_shared_db_is_one_budget_across_processes(clock, tmp_path):
+    path = str(tmp_path / "rate.db")
+    a, b = limiter("user=3:1", db_path=path), limiter("user=3:1", db_path=path)
+    assert [a.allow({"user": 1}), b.allow({"user": 1}), a.allow({"user": 1})] == [True] * 3
+    assert not b.allow({"user": 1})
+    clock.advance(1)
+    assert b.allow({"user": 1})
+    assert not a.allow({"user": 1})
+    assert a.failed_open == b.failed_open == 0
+
+def test_shared_db_fails_open_quickly_when_locked(clock, tmp_path, caplog):
+    path = str(tmp_path / "rate.db")
+    rl = limiter("user=1:0", db_path=path, db_wait_ms=20)
+    blocker = sqlite3.connect(path, isolation_level=None)
+    blocker.execute("BEGIN IMMEDIATE")
+    try:
+        with caplog.at_level(logging.WARNING, logger=main.logger.name):
+            t0 = time.perf_counter()
+            results = [rl.allow({"user": 1}) for _ in range(3)]
+            elapsed = time.perf_counter() - t0
+    finally:
+        blocker.execute("ROLLBACK")
+        blocker.close()
+    assert results == [True] * 3
+    assert elapsed < 1.0                    # ~20 ms each, not the old 2 s busy_timeout
+    assert rl.failed_open == 3
+    assert sum("Shared rate limiter unavailable" in r.message for r in caplog.records) == 1
+    # Once the lock is gone the budget applies again.
+    assert rl.allow({"user": 1})
+    assert not rl.allow({"user": 1})
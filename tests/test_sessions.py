@@ -0,0 +1,57 @@
+import main
+
+def test_auth_lasts_ttl(clock, db):
+    store = main.SessionStore(db, ttl=100, max_cached=10)
+    assert 1 not in store
+    store.add(1)
+    assert 1 in store
+    clock.advance(99)
+    assert 1 in store
+    clock.advance(1)
+    assert 1 not in store
+
+def test_add_refreshes_expiry(clock, db):
+    store = main.SessionStore(db, ttl=100, max_cached=10)
+    store.add(1)
+    clock.advance(80)
+    store.add(1)
+    clock.advance(80)
+    assert 1 in store
+
+def test_survives_a_restart(clock, db):
+    main.SessionStore(db, ttl=100, max_cached=10).add(7)
+    db.flush()
+    fresh = main.SessionStore(db, ttl=100, max_cached=10)
+    assert 7 in fresh
+    clock.advance(100)
+    assert 7 not in fresh
+
+def test_negative_answers_are_cached_briefly(clock, db):
+    store = main.SessionStore(db, ttl=100, max_cached=10)
+    other = main.SessionStore(db, ttl=100, max_cached=10)   # e.g. another worker
+    assert 3 not in store
+    other.add(3)
+    db.flush()
+    assert 3 not in store
+    clock.advance(main.SessionStore.NEGATIVE_TTL)
+    assert 3 in store
+
+def test_cache_is_bounded(clock, db):
+    store = main.SessionStore(db, ttl=100, max_cached=3)
+    for uid in range(10):
+        store.add(uid)
+    assert len(store._cache) == 3
+    db.flush()
+    assert 0 in store   # evicted entries read through to SQLite
+
+def test_sweep_drops_expired_rows(clock, db):
+    store = main.SessionStore(db, ttl=100, max_cached=10)
+    store.add(1)
+    clock.advance(50)
+    store.add(2)
+    clock.advance(60)
+    store.sweep()
+    db.flush()
+    rows = db.reader().execute("SELECT session_token FROM sessions").fetchall()
+    assert rows == [("tg:2",)]
+    assert 1 not in store._cache
@@ -0,0 +1,39 @@
+import random, re
+
+import pytest
+
+from main import split_utf16, utf16_len
+
+def squash(s: str) -> str:
+    return re.sub(r"\s+", "", s)
+
+def test_short_text_is_one_chunk():
+    assert split_utf16("  hello there  ", 4096) == ["hello there"]
+    assert split_utf16("", 10) == []
+
+def test_limit_counts_utf16_units():
+    text = "😀" * 10          # each emoji is a surrogate pair: 2 units
+    chunks = split_utf16(text, 5)
+    assert all(utf16_len(c) <= 5 for c in chunks)
+    assert "".join(chunks) == text
+    assert len(chunks) == 5   # 2 emojis per chunk; a pair is never cut
+
+def test_prefers_paragraphs_then_sentences_then_words():
+    a, b = "First paragraph here.", "Second one follows."
+    assert split_utf16(f"{a}\n\n{b}", 30) == [a, b]
+    assert split_utf16("One sentence. Another sentence.", 20) == ["One sentence.", "Another sentence."]
+    assert split_utf16("alpha beta gamma delta", 11) == ["alpha beta", "gamma delta"]
+
+def test_overlong_word_is_cut():
+    assert split_utf16("x" * 25, 10) == ["x" * 10, "x" * 10, "x" * 5]
+
+@pytest.mark.parametrize("seed", range(20))
+def test_random_text_round_trips_within_limit(seed):
+    rng = random.Random(seed)
+    alphabet = ["a", "b", "é", "漢", "😀", "👩‍💻", " ", " ", ".", "!", "\n", "\n\n"]
+    text = "".join(rng.choice(alphabet) for _ in range(rng.randrange(1, 3000)))
+    limit = rng.choice([7, 64, 500, 4096])
+    chunks = split_utf16(text, limit)
+    assert all(0 < utf16_len(c) <= limit for c in chunks)
+    assert all(c == c.strip() for c in chunks)
+    assert squash("".join(chunks)) == squash(text)
@@ -0,0 +1,18 @@
+import sqlite3
+
+import pytest
+
+from storage import SQLiteWriter
+
+def test_open_failure_raises_instead_of_hanging(tmp_path):
+    with pytest.raises(sqlite3.OperationalError):
+        SQLiteWriter(str(tmp_path / "missing" / "x.db"))
+
+def test_failed_job_does_not_sink_the_batch(db):
+    db.call(lambda c: c.execute("CREATE TABLE t (x INTEGER UNIQUE)"))
+    ok = db.execute("INSERT INTO t VALUES (1)")
+    dup = db.execute("INSERT INTO t VALUES (1)")
+    assert ok.result(5) == 1
+    with pytest.raises(sqlite3.IntegrityError):
+        dup.result(5)
+    assert db.call(lambda c: c.execute("SELECT COUNT(*) FROM t").fetchone()[0]) == 1
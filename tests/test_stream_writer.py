@@ -0,0 +1,53 @@
+import asyncio
+
+import pytest
+from telegram.error import BadRequest
+
+import main
+from main import utf16_len
+
+class Sent:
+    def __init__(self, log, text, fail_edits=False):
+        self.log = log
+        self.fail_edits = fail_edits
+        log.append(text)
+
+    async def edit_text(self, text):
+        if self.fail_edits:
+            raise BadRequest("Message can't be edited")
+        if utf16_len(text) > 4096:
+            raise BadRequest("Message is too long")
+        self.log[-1] = text
+
+class Message:
+    def __init__(self, fail_edits=False):
+        self.log = []
+        self.fail_edits = fail_edits
+
+    async def reply_text(self, text):
+        if utf16_len(text) > 4096:
+            raise BadRequest("Message is too long")
+        return Sent(self.log, text, self.fail_edits)
+
+async def tokens(items):
+    for t in items:
+        yield t
+
+@pytest.fixture(autouse=True)
+def fast_edits(monkeypatch):
+    monkeypatch.setattr(main, "STREAM_EDIT_INTERVAL", 0)
+    monkeypatch.setattr(main, "STREAM_MIN_DELTA", 1)
+
+def test_emoji_heavy_replies_roll_over_by_utf16_length():
+    msg = Message()
+    words = ["💕✨🫂 sayang"] * 800   # 3900 code points would be ~4.6k UTF-16 units
+    reply = asyncio.run(main.stream_reply(main.TelegramStreamWriter(msg), tokens(w + " " for w in words)))
+    assert len(msg.log) == 3
+    assert all(utf16_len(t) <= main.STREAM_ROLLOVER for t in msg.log)
+    assert "".join(reply.split()) == "".join("".join(words).split())
+
+def test_failed_final_edit_keeps_the_partial_reply():
+    msg = Message(fail_edits=True)
+    reply = asyncio.run(main.stream_reply(main.TelegramStreamWriter(msg), tokens(["hello", " there"])))
+    assert msg.log == ["hello"]
+    assert reply == "hello there"
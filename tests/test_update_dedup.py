@@ -0,0 +1,52 @@
+import main
+
+def test_drops_repeats_within_the_window(clock):
+    d = main.UpdateDeduper(window=60, max_ids=100)
+    assert d.first_time(1)
+    assert not d.first_time(1)
+    assert d.first_time(2)
+    clock.advance(59)
+    assert not d.first_time(1)
+    assert d.dropped == 2
+
+def test_window_expires(clock):
+    d = main.UpdateDeduper(window=60, max_ids=100)
+    d.first_time(1)
+    clock.advance(61)
+    assert d.first_time(1)
+
+def test_bounded_by_max_ids(clock):
+    d = main.UpdateDeduper(window=60, max_ids=3)
+    for uid in range(5):
+        assert d.first_time(uid)
+    assert len(d._seen) == 3
+    assert d.first_time(0)          # oldest ids were evicted
+    assert not d.first_time(4)
+
+def test_checking_a_full_set_keeps_the_checked_id(clock):
+    d = main.UpdateDeduper(window=60, max_ids=2)
+    d.first_time(1)
+    d.first_time(2)
+    assert not d.first_time(1)
+    assert not d.first_time(2)
+
+def test_window_survives_a_restart(clock, db):
+    d = main.UpdateDeduper(window=60, max_ids=100, db=db)
+    d.first_time(10)
+    d.first_time(11)
+    db.flush()
+    again = main.UpdateDeduper(window=60, max_ids=100, db=db)
+    assert not again.first_time(10)
+    assert again.first_time(12)
+    clock.advance(61)
+    db.flush()
+    assert main.UpdateDeduper(window=60, max_ids=100, db=db).first_time(11)
+
+def test_old_rows_are_pruned(clock, db, monkeypatch):
+    monkeypatch.setattr(main.UpdateDeduper, "PRUNE_EVERY", 2)
+    d = main.UpdateDeduper(window=60, max_ids=100, db=db)
+    d.first_time(1)
+    clock.advance(61)
+    d.first_time(2)
+    db.flush()
+    assert db.reader().execute("SELECT update_id FROM seen_updates").fetchall() == [(2,)]